@@ -0,0 +1,161 @@
+"""Headless batch processing: apply one edit recipe to many files
+
+Usage:
+    python batch.py "grayscale; blur 5; rotate 90" photos/*.jpg -o out/
+    python batch.py look.recipe.json photos/*.jpg -o out/
+
+The recipe is a ``;``-separated list of steps, each mapped onto an
+ImageProcessor method, or a recipe file saved from the editor
+(see img_recipe). This module never imports tkinter or PIL.ImageTk.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from img_processor import ImageProcessor
+from img_recipe import Recipe
+
+
+# Recipe step -> (ImageProcessor method, argument converters)
+RECIPE_STEPS = {
+    'grayscale': ('convert_to_grayscale', ()),
+    'blur': ('apply_blur', (int,)),
+    'edges': ('detect_edges', ()),
+    'brightness': ('adjust_brightness', (int,)),
+    'contrast': ('adjust_contrast', (float,)),
+    'gamma': ('adjust_gamma', (float,)),
+    'rotate': ('rotate_image', (int,)),
+    'flip': ('flip_image', (str,)),
+    'scale': ('scale_image', (int,)),
+    'resize': ('resize_image', (int, int)),
+}
+
+
+def parse_recipe(text):
+    """Parse "grayscale; blur 5" into [('apply_blur', (5,)), ...]"""
+    steps = []
+    for part in text.split(';'):
+        words = part.split()
+        if not words:
+            continue
+        name, args = words[0].lower(), words[1:]
+        if name not in RECIPE_STEPS:
+            raise ValueError(f"Unknown recipe step: {name}")
+        method, converters = RECIPE_STEPS[name]
+        if len(args) != len(converters):
+            raise ValueError(f"'{name}' takes {len(converters)} argument(s), got {len(args)}")
+        steps.append((method, tuple(convert(arg) for convert, arg in zip(converters, args))))
+    return steps
+
+
+def load_recipe(text):
+    """A recipe file path, or inline steps for ``parse_recipe``"""
+    if os.path.isfile(text):
+        return Recipe.load(text)
+    return parse_recipe(text)
+
+
+def process_file(source, target, steps):
+    """Run the recipe on one file; returns (source, ok, seconds, megapixels)
+
+    ``steps`` is a parsed inline recipe or a Recipe loaded from a file.
+    """
+    start = time.perf_counter()
+    # Lazy mode fuses adjacent ops and keeps no undo history
+    processor = ImageProcessor(lazy=True)
+    if not processor.load_image(source):
+        return source, False, time.perf_counter() - start, 0.0
+    info = processor.get_image_info()
+    megapixels = info['width'] * info['height'] / 1e6
+    if isinstance(steps, Recipe):
+        processor.apply_recipe(steps)
+    else:
+        for method, args in steps:
+            getattr(processor, method)(*args)
+    ok = processor.save_image(target)
+    return source, bool(ok), time.perf_counter() - start, megapixels
+
+
+def expand_inputs(patterns):
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        files.extend(matches if matches else [pattern])
+    # Keep order, drop duplicates
+    return list(dict.fromkeys(path for path in files if os.path.isfile(path)))
+
+
+def target_path(source, output_dir, extension=None):
+    name = os.path.basename(source)
+    if extension:
+        name = os.path.splitext(name)[0] + '.' + extension.lstrip('.')
+    return os.path.join(output_dir, name)
+
+
+def run_batch(steps, files, output_dir, workers=None, max_in_flight=None,
+              extension=None, report=print):
+    """Process files across a process pool, keeping at most max_in_flight queued"""
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        queue = iter(files)
+        while True:
+            # Bound in-flight work so decoded frames never pile up in memory
+            for source in queue:
+                target = target_path(source, output_dir, extension)
+                pending.add(pool.submit(process_file, source, target, steps))
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                source, ok, seconds, megapixels = future.result()
+                results.append((source, ok, seconds, megapixels))
+                status = "ok" if ok else "FAILED"
+                rate = megapixels / seconds if seconds > 0 else 0.0
+                report(f"{status:6} {seconds * 1000:8.1f} ms {rate:7.1f} MP/s  {source}")
+    elapsed = time.perf_counter() - start
+    succeeded = [r for r in results if r[1]]
+    total_mp = sum(r[3] for r in succeeded)
+    report(f"{len(succeeded)}/{len(results)} files in {elapsed:.2f} s | "
+           f"{len(succeeded) / elapsed if elapsed else 0:.2f} files/s | "
+           f"{total_mp / elapsed if elapsed else 0:.1f} MP/s")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply an edit recipe to many images")
+    parser.add_argument('recipe', help='steps separated by ";", e.g. "grayscale; blur 5", '
+                                       'or a recipe file saved from the editor')
+    parser.add_argument('inputs', nargs='+', help='input files or glob patterns')
+    parser.add_argument('-o', '--output', required=True, help='output directory')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='worker processes')
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help='files queued at once (default: 2 x workers)')
+    parser.add_argument('--format', dest='extension', default=None,
+                        help='output extension, e.g. png (default: keep)')
+    args = parser.parse_args(argv)
+
+    try:
+        steps = load_recipe(args.recipe)
+    except (OSError, KeyError, TypeError, ValueError) as error:
+        parser.error(str(error))
+    files = expand_inputs(args.inputs)
+    if not files:
+        parser.error("no input files matched")
+
+    results = run_batch(steps, files, args.output, args.workers,
+                        args.max_in_flight, args.extension)
+    return 0 if all(ok for _, ok, _, _ in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,385 @@
+"""Performance benchmarks for ImageProcessor, image I/O and ImageDisplay
+
+Usage:
+    python benchmark.py -o results.json                 # run and save
+    python benchmark.py --sizes 1 4 --quick             # small smoke run
+    python benchmark.py --compare baseline.json         # run and flag regressions
+    python benchmark.py --compare baseline.json --results results.json
+    python benchmark.py --startup-only --startup-budget 800
+
+Each case records the median wall time over ``--repeat`` runs, the peak
+resident set size above the pre-run baseline (sampled from /proc where
+available) and the peak/total bytes allocated as seen by tracemalloc
+(NumPy and OpenCV outputs are allocated through NumPy, so they show up).
+
+Startup is measured in fresh interpreters: the time to import the editor,
+the time to the first frame (window laid out and drawn, no controls yet)
+and the time until every deferred control section is built. None of cv2,
+numpy or PIL may be imported before the first image is opened.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import img_backends
+from img_processor import ImageProcessor
+
+
+DEFAULT_SIZES = (1, 4, 12, 24, 50, 100)
+BLUR_INTENSITIES = (1, 5, 9, 15, 25)
+
+# Default time-to-first-frame budget (ms)
+STARTUP_BUDGET_MS = 1000.0
+
+# Modules that must stay unloaded until an image is opened
+HEAVY_MODULES = ('cv2', 'numpy', 'PIL.ImageTk')
+
+_STARTUP_SCRIPT = r"""
+import json, sys, time
+start = time.perf_counter()
+import img_editor
+result = {'import_ms': (time.perf_counter() - start) * 1000,
+          'first_frame_ms': None, 'controls_ms': None}
+try:
+    import tkinter as tk
+    root = tk.Tk()
+except Exception:
+    root = None
+if root is not None:
+    app = img_editor.ImageEditor(root)
+    root.update_idletasks()
+    result['first_frame_ms'] = (time.perf_counter() - start) * 1000
+    result['heavy'] = [m for m in %r if m in sys.modules]
+    while app._pending_sections:
+        root.update()
+    result['controls_ms'] = (time.perf_counter() - start) * 1000
+    root.destroy()
+else:
+    result['heavy'] = [m for m in %r if m in sys.modules]
+print(json.dumps(result))
+""" % (HEAVY_MODULES, HEAVY_MODULES)
+
+
+def synthetic_image(megapixels, seed=0):
+    """Deterministic 3:2 BGR test image with gradients, shapes and noise"""
+    width = int((megapixels * 1e6 * 1.5) ** 0.5)
+    height = int(megapixels * 1e6 / width)
+    rng = np.random.default_rng(seed)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[..., 0] = np.linspace(0, 255, width, dtype=np.uint8)[None, :]
+    image[..., 1] = np.linspace(0, 255, height, dtype=np.uint8)[:, None]
+    image[..., 2] = 128
+    for _ in range(20):
+        center = (int(rng.integers(width)), int(rng.integers(height)))
+        radius = int(rng.integers(min(width, height) // 20 + 1, min(width, height) // 4 + 2))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.circle(image, center, radius, color, -1)
+    noise = rng.integers(-12, 13, size=image.shape[:2], dtype=np.int16)
+    return cv2.add(image, cv2.merge([noise, noise, noise]), dtype=cv2.CV_8U)
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as handle:
+            return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class _RssSampler:
+    """Samples resident memory on a background thread to find the peak"""
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.baseline = _rss_bytes()
+        self.peak = self.baseline
+        if self.baseline is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._sample()
+
+    def _sample(self):
+        rss = _rss_bytes()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    @property
+    def delta(self):
+        if self.baseline is None:
+            return None
+        return self.peak - self.baseline
+
+
+def measure(run, setup=None, repeat=3):
+    """Time ``run`` and record its memory use; ``setup`` runs untimed first"""
+    times = []
+    peak_rss = 0
+    for _ in range(repeat):
+        state = setup() if setup else None
+        with _RssSampler() as sampler:
+            start = time.perf_counter()
+            run(state)
+            times.append(time.perf_counter() - start)
+        if sampler.delta is not None:
+            peak_rss = max(peak_rss, sampler.delta)
+        del state
+
+    # One extra run under tracemalloc for allocation statistics
+    state = setup() if setup else None
+    tracemalloc.start()
+    run(state)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'wall_ms': statistics.median(times) * 1000,
+        'min_ms': min(times) * 1000,
+        'peak_rss_mb': peak_rss / 2 ** 20,
+        'alloc_peak_mb': peak / 2 ** 20,
+        'alloc_retained_mb': current / 2 ** 20,
+    }
+
+
+def processor_cases():
+    """(name, function(processor)) for every ImageProcessor operation"""
+    cases = [
+        ('convert_to_grayscale', lambda p: p.convert_to_grayscale()),
+        ('detect_edges', lambda p: p.detect_edges()),
+        ('adjust_brightness', lambda p: p.adjust_brightness(40)),
+        ('adjust_contrast', lambda p: p.adjust_contrast(1.5)),
+        ('rotate_image[90]', lambda p: p.rotate_image(90)),
+        ('rotate_image[180]', lambda p: p.rotate_image(180)),
+        ('flip_image[horizontal]', lambda p: p.flip_image('horizontal')),
+        ('flip_image[vertical]', lambda p: p.flip_image('vertical')),
+        ('scale_image[50]', lambda p: p.scale_image(50)),
+        ('scale_image[150]', lambda p: p.scale_image(150)),
+        ('get_current_image', lambda p: p.get_current_image()),
+        ('undo', lambda p: p.undo()),
+    ]
+    for intensity in BLUR_INTENSITIES:
+        cases.append((f'apply_blur[{intensity}]', lambda p, k=intensity: p.apply_blur(k)))
+    return cases
+
+
+def _display_factory():
+    """Return a function creating an ImageDisplay, or None without a screen"""
+    try:
+        import tkinter as tk
+        from img_display import ImageDisplay
+        root = tk.Tk()
+        root.withdraw()
+    except Exception:
+        return None
+    return lambda: ImageDisplay(tk.Frame(root), 900, 650)
+
+
+def measure_startup(repeat=3):
+    """Median startup timings over fresh interpreters (see module docstring)"""
+    runs = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, '-c', _STARTUP_SCRIPT],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        )
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    result = {'heavy_modules': sorted({m for run in runs for m in run['heavy']})}
+    for key in ('import_ms', 'first_frame_ms', 'controls_ms'):
+        values = [run[key] for run in runs if run[key] is not None]
+        result[key] = statistics.median(values) if values else None
+    return result
+
+
+def check_startup(startup, budget_ms=STARTUP_BUDGET_MS):
+    """Return startup budget violations as strings"""
+    problems = []
+    # Without a display only the import can be timed
+    measured = startup['first_frame_ms']
+    label = 'time to first frame'
+    if measured is None:
+        measured, label = startup['import_ms'], 'editor import'
+    if measured > budget_ms:
+        problems.append(f"{label} {measured:.0f} ms exceeds the {budget_ms:.0f} ms budget")
+    if startup['heavy_modules']:
+        problems.append("imported before the first image: " + ", ".join(startup['heavy_modules']))
+    return problems
+
+
+def _startup_results(startup):
+    """Startup timings as result rows, so --compare tracks them too"""
+    rows = []
+    for key in ('import_ms', 'first_frame_ms', 'controls_ms'):
+        if startup[key] is not None:
+            rows.append({'name': f"startup[{key[:-3]}]", 'megapixels': 0, 'width': 0,
+                         'height': 0, 'wall_ms': startup[key], 'min_ms': startup[key],
+                         'peak_rss_mb': 0.0, 'alloc_peak_mb': 0.0, 'alloc_retained_mb': 0.0})
+    return rows
+
+
+def run_benchmarks(sizes, repeat=3, report=print):
+    results = []
+    startup = measure_startup(repeat)
+    report("startup: " + ", ".join(
+        f"{key[:-3]} {startup[key]:.0f} ms" for key in ('import_ms', 'first_frame_ms', 'controls_ms')
+        if startup[key] is not None))
+    results.extend(_startup_results(startup))
+    # Pick the "auto" kernel backend now so its one-off probe is not timed
+    img_backends.auto_backend()
+    display_factory = _display_factory()
+    workdir = tempfile.mkdtemp(prefix='img_bench_')
+
+    for megapixels in sizes:
+        image = synthetic_image(megapixels)
+        height, width = image.shape[:2]
+        report(f"--- {megapixels} MP ({width}x{height})")
+
+        def record(name, metrics):
+            metrics.update({'name': name, 'megapixels': megapixels,
+                            'width': width, 'height': height})
+            results.append(metrics)
+            report(f"{name:28} {metrics['wall_ms']:10.2f} ms  "
+                   f"rss +{metrics['peak_rss_mb']:8.1f} MB  "
+                   f"alloc {metrics['alloc_peak_mb']:8.1f} MB")
+
+        for name, operation in processor_cases():
+            def setup(name=name):
+                processor = ImageProcessor()
+                processor.set_image(image)
+                if name == 'undo':
+                    processor.adjust_brightness(10)
+                return processor
+            record(name, measure(operation, setup, repeat))
+
+        for extension in ('png', 'jpg', 'tif'):
+            path = os.path.join(workdir, f'bench_{megapixels}.{extension}')
+
+            def save_setup():
+                processor = ImageProcessor()
+                processor.set_image(image)
+                return processor
+            record(f'save_image[{extension}]',
+                   measure(lambda p, path=path: p.save_image(path), save_setup, repeat))
+            record(f'load_image[{extension}]',
+                   measure(lambda p, path=path: ImageProcessor().load_image(path), None, repeat))
+            os.remove(path)
+
+        if display_factory is not None:
+            record('display_image', measure(lambda d: d.display_image(image),
+                                            display_factory, repeat))
+        del image
+
+    os.rmdir(workdir)
+    return {
+        'meta': {
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'repeat': repeat,
+            'display': display_factory is not None,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'startup': startup,
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=0.15, memory_threshold=0.25, min_ms=1.0):
+    """Return regressions of ``current`` against ``baseline`` as strings"""
+    reference = {(r['name'], r['megapixels']): r for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        before = reference.get((result['name'], result['megapixels']))
+        if before is None:
+            continue
+        label = f"{result['name']} @ {result['megapixels']} MP"
+        # Ignore jitter on sub-millisecond cases
+        if result['wall_ms'] > max(before['wall_ms'] * (1 + threshold), before['wall_ms'] + min_ms):
+            regressions.append(f"{label}: time {before['wall_ms']:.2f} -> {result['wall_ms']:.2f} ms")
+        for key in ('peak_rss_mb', 'alloc_peak_mb'):
+            limit = before[key] * (1 + memory_threshold) + 1.0
+            if result[key] > limit:
+                regressions.append(f"{label}: {key} {before[key]:.1f} -> {result[key]:.1f} MB")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark image editor operations")
+    parser.add_argument('--sizes', type=float, nargs='+', default=list(DEFAULT_SIZES),
+                        help='image sizes in megapixels')
+    parser.add_argument('--quick', action='store_true', help='one repeat per case')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('-o', '--output', help='write results JSON here')
+    parser.add_argument('--compare', metavar='BASELINE', help='flag regressions against this JSON')
+    parser.add_argument('--results', help='compare these stored results instead of running')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='allowed relative slowdown before flagging (default 0.15)')
+    parser.add_argument('--startup-budget', type=float, default=STARTUP_BUDGET_MS,
+                        help=f'time-to-first-frame budget in ms (default {STARTUP_BUDGET_MS:.0f})')
+    parser.add_argument('--startup-only', action='store_true',
+                        help='only measure startup and check its budget')
+    args = parser.parse_args(argv)
+
+    if args.startup_only:
+        startup = measure_startup(1 if args.quick else args.repeat)
+        print(json.dumps(startup, indent=2))
+        problems = check_startup(startup, args.startup_budget)
+        for line in problems:
+            print(f"STARTUP {line}")
+        return 1 if problems else 0
+
+    if args.results:
+        with open(args.results) as handle:
+            current = json.load(handle)
+    else:
+        current = run_benchmarks(args.sizes, 1 if args.quick else args.repeat)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(current, handle, indent=2)
+
+    failed = False
+    if 'startup' in current:
+        for line in check_startup(current['startup'], args.startup_budget):
+            print(f"STARTUP {line}")
+            failed = True
+
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)
+        regressions = compare(baseline, current, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print("No regressions")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""Interchangeable implementations of the img_ops kernels
+
+- "numpy": the cv2 kernels of img_ops on plain arrays (always available,
+  and the fallback for any op another backend does not implement)
+- "umat": the same cv2 calls on ``cv2.UMat``, so OpenCV's transparent API
+  can dispatch to OpenCL where a device is present
+- "reference": the pure-NumPy kernels of img_reference
+- "auto": per op, the fastest of the above that matches "numpy" exactly
+  on a probe image; measured once per process, on first use
+
+"umat" and "reference" are checked against "numpy" on the same probe
+when first chosen; an op whose output differs falls back to "numpy" and
+is listed in the backend's ``inexact``.
+"""
+import time
+
+import cv2
+import numpy as np
+
+import img_ops
+import img_reference
+
+
+# Ops routed through cv2.UMat; each one is a single cv2 call
+_UMAT_OPS = ('grayscale', 'blur', 'edges', 'brightness', 'contrast',
+             'rotate', 'flip', 'resize')
+
+# (op, params) timed when picking the "auto" backend
+PROBE_CASES = (
+    ('grayscale', {}),
+    ('blur', {'intensity': 5}),
+    ('edges', {}),
+    ('brightness', {'value': 30}),
+    ('contrast', {'value': 1.5}),
+    ('rotate', {'angle': 90}),
+    ('flip', {'direction': 'horizontal'}),
+    ('resize', {'width': 200, 'height': 150}),
+)
+
+
+class Backend:
+    def __init__(self, name, kernels, inexact=()):
+        self.name = name
+        self.kernels = dict(kernels)
+        # Probe ops replaced by the "numpy" kernel because they differed
+        self.inexact = tuple(inexact)
+
+    def __repr__(self):
+        return f"Backend({self.name!r})"
+
+    def kernel(self, op):
+        return self.kernels.get(op, img_ops.OPS[op])
+
+    def run(self, op, image, **params):
+        return self.kernel(op)(image, **params)
+
+
+def _on_umat(kernel):
+    # UMat results are downloaded into a new array, so ``out`` goes unused.
+    # Single-channel images stay on plain arrays, where kernels can tell
+    # them apart from BGR.
+    def run(image, out=None, **params):
+        if image.ndim == 2:
+            return kernel(image, out=out, **params)
+        return kernel(cv2.UMat(image), **params).get()
+    return run
+
+
+def _umat_available():
+    if not hasattr(cv2, 'UMat'):
+        return False
+    if cv2.ocl.haveOpenCL():
+        cv2.ocl.setUseOpenCL(True)
+    return True
+
+
+BACKENDS = {'numpy': Backend('numpy', img_ops.OPS)}
+if _umat_available():
+    BACKENDS['umat'] = Backend('umat', {op: _on_umat(img_ops.OPS[op]) for op in _UMAT_OPS})
+BACKENDS['reference'] = Backend('reference', img_reference.KERNELS)
+
+_auto = None
+_checked = {}
+
+
+def probe_image(width=384, height=256):
+    """Small deterministic BGR image with edges, gradients and noise"""
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    image[:, : width // 2] //= 4
+    cv2.circle(image, (width // 2, height // 2), height // 3, (40, 200, 120), -1)
+    return image
+
+
+def benchmark(image=None, repeat=3):
+    """Time every backend on the probe ops
+
+    Returns ``{op: {backend name: seconds}}``. A backend whose output
+    differs from "numpy" in any way is left out for that op.
+    """
+    if image is None:
+        image = probe_image()
+    timings = {}
+    for op, params in PROBE_CASES:
+        expected = img_ops.OPS[op](image, **params)
+        timings[op] = {}
+        for name, backend in BACKENDS.items():
+            if name != 'numpy' and op not in backend.kernels:
+                continue
+            kernel = backend.kernel(op)
+            if not _exact(kernel, image, params, expected):
+                continue
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                kernel(image, **params)
+                best = min(best, time.perf_counter() - start)
+            timings[op][name] = best
+    return timings
+
+
+def _exact(kernel, image, params, expected):
+    try:
+        result = kernel(image, **params)
+    except cv2.error:
+        return False
+    return result.shape == expected.shape and np.array_equal(result, expected)
+
+
+def checked_backend(name):
+    """``name``'s kernels with every inexact probe op on "numpy" (checked once)"""
+    if name not in _checked:
+        backend = BACKENDS[name]
+        image = probe_image()
+        inexact = [op for op, params in PROBE_CASES if op in backend.kernels
+                   and not _exact(backend.kernels[op], image, params,
+                                  img_ops.OPS[op](image, **params))]
+        kernels = {op: kernel for op, kernel in backend.kernels.items() if op not in inexact}
+        _checked[name] = Backend(name, kernels, inexact)
+    return _checked[name]
+
+
+def auto_backend():
+    """Backend made of the fastest exact kernel per op (measured once)"""
+    global _auto
+    if _auto is None:
+        kernels = {}
+        for op, times in benchmark().items():
+            fastest = min(times, key=times.get)
+            kernels[op] = BACKENDS[fastest].kernel(op)
+        _auto = Backend('auto', kernels)
+    return _auto
+
+
+def get_backend(name='auto'):
+    if name == 'auto':
+        return auto_backend()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown or unavailable backend: {name}")
+    if name == 'numpy':
+        return BACKENDS[name]
+    return checked_backend(name)
+
+
+def available_backends():
+    return ['auto'] + list(BACKENDS)
@@ -0,0 +1,131 @@
+"""Copy-on-write handling for image arrays
+
+An array's ``writeable`` flag is the copy-on-write marker: once an image has
+been handed out it is frozen, and any code that wants to modify it in place
+must ``thaw`` it first, which copies only if the buffer is shared.
+"""
+import threading
+import weakref
+import zlib
+
+import numpy as np
+
+
+def freeze(image):
+    """Mark an image as shared and return it (no copy)"""
+    if image is not None and image.flags.writeable:
+        image.flags.writeable = False
+    return image
+
+
+def thaw(image):
+    """Return an array that is safe to modify in place, copying only if frozen"""
+    if image.flags.writeable:
+        return image
+    return image.copy()
+
+
+class BufferArena:
+    """Recycles image buffers by shape and dtype
+
+    ``take`` hands out an uninitialised array, typically passed as ``dst=``
+    to a cv2 call. Its memory returns to the arena once the array and every
+    view of it have been garbage collected, so frozen images shared with
+    history or the display are never recycled while still in use. Idle
+    buffers are kept up to ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes=128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._idle = {}
+        self._idle_bytes = 0
+        self._leased_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def take(self, shape, dtype=np.uint8):
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+        key = (shape, dtype.str)
+        with self._lock:
+            blocks = self._idle.get(key)
+            if blocks:
+                block = blocks.pop()
+                self._idle_bytes -= len(block)
+                self.hits += 1
+            else:
+                block = None
+                self.misses += 1
+        if block is None:
+            block = bytearray(max(1, int(np.prod(shape)) * dtype.itemsize))
+        # The block is not an ndarray, so every view of the lease keeps the
+        # lease itself alive and the finalizer only runs once nothing uses it
+        lease = np.ndarray(shape, dtype=dtype, buffer=block)
+        with self._lock:
+            self._leased_bytes += len(block)
+        weakref.finalize(lease, self._give_back, key, block)
+        return lease
+
+    def take_like(self, image):
+        return self.take(image.shape, image.dtype)
+
+    def _give_back(self, key, block):
+        with self._lock:
+            self._leased_bytes -= len(block)
+            if self._idle_bytes + len(block) <= self.max_bytes:
+                self._idle.setdefault(key, []).append(block)
+                self._idle_bytes += len(block)
+
+    def clear(self):
+        """Drop every idle buffer"""
+        with self._lock:
+            self._idle.clear()
+            self._idle_bytes = 0
+
+    def resize(self, max_bytes):
+        """Change how many bytes of idle buffers are kept, dropping any excess"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            for blocks in self._idle.values():
+                while blocks and self._idle_bytes > max_bytes:
+                    self._idle_bytes -= len(blocks.pop())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'bytes_held': self._idle_bytes,
+                'bytes_leased': self._leased_bytes,
+            }
+
+
+class PackedImage:
+    """zlib-compressed copy of an image, for documents that are not on screen"""
+
+    def __init__(self, image, level=1):
+        self.shape = image.shape
+        self.dtype = image.dtype
+        self.data = zlib.compress(np.ascontiguousarray(image).data, level)
+
+    @property
+    def nbytes(self):
+        return len(self.data)
+
+    def unpack(self):
+        raw = bytearray(zlib.decompress(self.data))
+        return freeze(np.frombuffer(raw, dtype=self.dtype).reshape(self.shape))
+
+
+def pack(image):
+    """Compress an image; memory-mapped images are already cheap to keep"""
+    if image is None or isinstance(image, np.memmap):
+        return image
+    return PackedImage(image)
+
+
+def unpack(packed):
+    if isinstance(packed, PackedImage):
+        return packed.unpack()
+    return packed
@@ -1,7 +1,111 @@
+import math
 import tkinter as tk
+from collections import OrderedDict
 from tkinter import Canvas
-from PIL import Image, ImageTk
-import cv2
+
+from img_profiler import stage
+
+
+# Longest edge of the largest pyramid level kept per history state
+PYRAMID_BASE = 2048
+
+# Viewport tiles are TILE_SIZE x TILE_SIZE canvas pixels
+TILE_SIZE = 256
+MAX_CACHED_TILES = 384
+MAX_ZOOM = 16.0
+
+
+class DisplayCache:
+    """LRU cache of ready-to-blit RGB images, bounded by a byte budget"""
+    
+    def __init__(self, max_bytes=128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._nbytes = 0
+    
+    
+    def get(self, key):
+        item = self._items.get(key)
+        if item is not None:
+            self._items.move_to_end(key)
+        return item
+    
+    
+    def put(self, key, item, nbytes):
+        if key in self._items:
+            self._nbytes -= self._items.pop(key)[1]
+        self._items[key] = (item, nbytes)
+        self._nbytes += nbytes
+        while self._nbytes > self.max_bytes and len(self._items) > 1:
+            _, (_, evicted) = self._items.popitem(last=False)
+            self._nbytes -= evicted
+    
+    
+    def clear(self):
+        self._items.clear()
+        self._nbytes = 0
+
+
+def _to_rgb(image):
+    """BGR to RGB; single-channel images are shown as they are (PIL mode "L")"""
+    import cv2
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def build_pyramid(cv_image):
+    """RGB levels of an image, each half the size of the previous one
+
+    Level 0 is capped at PYRAMID_BASE on the longest edge, so everything
+    after the first build works on small arrays.
+    """
+    import cv2
+    import img_ops
+    height, width = cv_image.shape[:2]
+    scale = min(1.0, PYRAMID_BASE / max(height, width))
+    if scale < 1.0:
+        level = img_ops.shrink(cv_image, max(1, int(width * scale)), max(1, int(height * scale)))
+    else:
+        level = cv_image
+    levels = [_to_rgb(level)]
+    while min(levels[-1].shape[:2]) > 64:
+        levels.append(cv2.pyrDown(levels[-1]))
+    return levels
+
+
+def fit_size(width, height, canvas_size):
+    """Size of a ``width`` x ``height`` image fitted to the canvas, never enlarged"""
+    canvas_width, canvas_height = canvas_size
+    scale = min(canvas_width / width, canvas_height / height, 1.0)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def fit_pyramid(levels, shape, canvas_size):
+    """Fitted RGB image from the pyramid of an image of ``shape``"""
+    import cv2
+    new_width, new_height = fit_size(shape[1], shape[0], canvas_size)
+    # Smallest level that is still at least as large as the target
+    source = levels[0]
+    for level in levels:
+        if level.shape[1] >= new_width and level.shape[0] >= new_height:
+            source = level
+    if source.shape[:2] != (new_height, new_width):
+        source = cv2.resize(source, (new_width, new_height), interpolation=cv2.INTER_AREA)
+    return source
+
+
+def prepare(cv_image, canvas_size):
+    """Everything display_image needs to show a state, built off the Tk thread
+
+    Returns the image's pyramid and its fitted RGB image for a canvas of
+    ``canvas_size`` (see ImageDisplay.get_size); pass it to display_image
+    along with the state key so showing the state only blits.
+    """
+    with stage('display.pyramid'):
+        levels = build_pyramid(cv_image)
+        shape = cv_image.shape[:2]
+        return levels, shape, canvas_size, fit_pyramid(levels, shape, canvas_size)
 
 
 class ImageDisplay:
@@ -28,6 +132,29 @@ class ImageDisplay:
         self._show_placeholder()
         
         self._image_id = None
+        
+        # Pyramids per history state plus fitted images per canvas size
+        self._cache = DisplayCache()
+        self._pyramid = None        # (key, pyramid) of the shown state
+        self._shown = None
+        self._canvas.bind('<Configure>', self._on_resize)
+        
+        # Zoom & pan viewport: only visible tiles are rendered
+        self._viewport = False
+        self._zoom = 1.0
+        self._origin = (0.0, 0.0)   # source pixel at the canvas top-left
+        self._levels = {}           # source pyramid for the shown state
+        self._levels_key = None
+        self._tile_cache = OrderedDict()
+        self._placed = {}           # (tx, ty) -> (canvas item, PhotoImage)
+        self._placed_key = None
+        self._drag = None
+        self._canvas.bind('<MouseWheel>', self._on_wheel)
+        self._canvas.bind('<Button-4>', self._on_wheel)
+        self._canvas.bind('<Button-5>', self._on_wheel)
+        self._canvas.bind('<ButtonPress-1>', self._on_drag_start)
+        self._canvas.bind('<B1-Motion>', self._on_drag)
+        self._canvas.bind('<Double-Button-1>', lambda e: self.fit_to_window())
     
     
     def _show_placeholder(self):
@@ -72,49 +199,120 @@ class ImageDisplay:
         )
     
     
-    def display_image(self, cv_image):
+    def get_size(self):
+        return self._width, self._height
+    
+    
+    def display_image(self, cv_image, key=None, prepared=None):
+        """Show an image fitted to the canvas
+
+        ``key`` identifies the edit state (see ImageProcessor.get_state_key);
+        with a key, redraws of a state shown before (after undo/redo or a
+        window resize) come from the cache without touching ``cv_image``.
+        ``prepared`` (from ``prepare`` on a worker) fills the cache for the
+        key, so nothing full-size is resampled here.
+        """
         if cv_image is None:
             return
         
+        self._hide_placeholder()
+        self._shown = (cv_image, key)
+        if prepared is not None and key is not None:
+            levels, shape, size, fitted = prepared
+            self._pyramid = (key, (levels, shape))
+            self._cache.put(key, (levels, shape), sum(level.nbytes for level in levels))
+            self._cache.put((key, size), fitted, fitted.nbytes)
+        
+        if self._viewport and key is not None:
+            with stage('display.tiles'):
+                self._render_viewport()
+            return
+        self._clear_tiles()
+        
+        with stage('display.rgb'):
+            if key is None:
+                rgb_image = self._fit(cv_image)
+            else:
+                rgb_image = self._fit_cached(cv_image, key)
+        
+        self._blit(rgb_image)
+    
+    
+    def display_preview(self, cv_image, width, height):
+        """Show a reduced decode at the size the full ``width`` x ``height``
+        image will have; nothing is cached and zoom waits for the full image"""
+        import cv2
+        self._hide_placeholder()
+        self._shown = None
+        self._viewport = False
+        self._clear_tiles()
+        new_width, new_height = self._fit_size(width, height)
+        with stage('display.rgb'):
+            preview = cv2.resize(cv_image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+            self._blit(_to_rgb(preview))
+    
+    
+    def _hide_placeholder(self):
         if hasattr(self, '_placeholder_bg'):
             self._canvas.delete(self._placeholder_bg)
             self._canvas.delete(self._placeholder_icon)
             self._canvas.delete(self._placeholder_text)
             self._canvas.delete(self._placeholder_subtitle)
+    
+    
+    def _fit_size(self, width, height):
+        return fit_size(width, height, (self._width, self._height))
+    
+    
+    def _fit(self, cv_image):
+        """Resize to fit the canvas, then convert BGR to RGB"""
+        import cv2
+        height, width = cv_image.shape[:2]
+        new_width, new_height = self._fit_size(width, height)
         
-        # Step 1- Converts BGR to RGB
-        rgb_image = cv2.cvtColor(cv_image, cv2.COLOR_BGR2RGB)
-        
-        # Step 2- Gets image size
-        height, width = rgb_image.shape[:2]
-        
-   
-        scale_width = self._width / width
-        scale_height = self._height / height
-        scale = min(scale_width, scale_height)
-        
-        if scale > 1.0:
-            scale = 1.0
-        
-        # Calculates new size
-        new_width = int(width * scale)
-        new_height = int(height * scale)
-        
-        # Resizes if needed
-        if scale < 1.0:
-            rgb_image = cv2.resize(rgb_image, (new_width, new_height))
+        # Resizes first so the colour conversion never touches a
+        # full-resolution frame (the image may be a shared read-only buffer)
+        if (new_width, new_height) != (width, height):
+            cv_image = cv2.resize(cv_image, (new_width, new_height))
+        return _to_rgb(cv_image)
+    
+    
+    def _fit_cached(self, cv_image, key):
+        """Fitted RGB image for a state, built from its cached pyramid"""
+        size = (self._width, self._height)
+        fitted = self._cache.get((key, size))
+        if fitted is not None:
+            return fitted[0]
         
-        # Step 3- Converts to PIL Image
-        pil_image = Image.fromarray(rgb_image)
+        pyramid = self._cache.get(key)
+        if pyramid is not None:
+            pyramid = pyramid[0]
+        elif self._pyramid is not None and self._pyramid[0] == key:
+            # Evicted, but the shown state's pyramid is still at hand
+            pyramid = self._pyramid[1]
+        else:
+            levels = build_pyramid(cv_image)
+            pyramid = (levels, cv_image.shape[:2])
+            self._cache.put(key, pyramid, sum(level.nbytes for level in levels))
+        fitted = fit_pyramid(*pyramid, size)
+        self._cache.put((key, size), fitted, fitted.nbytes)
+        return fitted
+    
+    
+    def _blit(self, rgb_image):
+        from PIL import Image, ImageTk
+        new_height, new_width = rgb_image.shape[:2]
         
-        # Step 4- Converts to PhotoImage
-        self._photo_image = ImageTk.PhotoImage(pil_image)
+        # Converts to PIL Image, then to PhotoImage
+        with stage('display.photoimage'):
+            pil_image = Image.fromarray(rgb_image)
+            self._photo_image = ImageTk.PhotoImage(pil_image)
         
-        # Step 5- Calculates position to center image
+        # Calculates position to center image
         x = (self._width - new_width) // 2
         y = (self._height - new_height) // 2
         
-        # Step 6- Display on canvas
+        # Display on canvas
         if self._image_id:
             self._canvas.delete(self._image_id) 
         
@@ -125,8 +323,264 @@ class ImageDisplay:
         )
     
     
+    def get_zoom(self):
+        """Current zoom; in fit mode, the scale the fitted image is shown at"""
+        if self._viewport or self._shown is None:
+            return self._zoom
+        height, width = self._shown[0].shape[:2]
+        return min(self._width / width, self._height / height, 1.0)
+    
+    
+    def fit_to_window(self):
+        """Leave the viewport and show the whole image fitted to the canvas"""
+        self._viewport = False
+        if self._shown is not None:
+            self.display_image(*self._shown)
+    
+    
+    def zoom_to(self, zoom, anchor=None):
+        """Enter the viewport at ``zoom`` (1.0 = one image pixel per screen
+        pixel), keeping the image point under ``anchor`` (canvas x, y) fixed"""
+        if self._shown is None or self._shown[1] is None:
+            return
+        height, width = self._shown[0].shape[:2]
+        if not self._viewport:
+            # Start from the fitted view so the zoom feels continuous
+            fit = min(self._width / width, self._height / height, 1.0)
+            self._zoom = fit
+            self._origin = (-(self._width - width * fit) / 2 / fit,
+                            -(self._height - height * fit) / 2 / fit)
+            self._viewport = True
+        if anchor is None:
+            anchor = (self._width / 2, self._height / 2)
+        zoom = max(min(self._width / width, self._height / height, 1.0) / 2, min(MAX_ZOOM, zoom))
+        ax, ay = anchor
+        ox, oy = self._origin
+        point = (ox + ax / self._zoom, oy + ay / self._zoom)
+        self._zoom = zoom
+        self._origin = (point[0] - ax / zoom, point[1] - ay / zoom)
+        self._render_viewport()
+    
+    
+    def _on_wheel(self, event):
+        if self._shown is None:
+            return "break"
+        if getattr(event, 'num', None) == 4 or getattr(event, 'delta', 0) > 0:
+            factor = 1.25
+        else:
+            factor = 0.8
+        self.zoom_to(self.get_zoom() * factor, (event.x, event.y))
+        # Keep the control panel's global wheel binding from scrolling too
+        return "break"
+    
+    
+    def _on_drag_start(self, event):
+        self._drag = (event.x, event.y)
+    
+    
+    def _on_drag(self, event):
+        if not self._viewport or self._drag is None:
+            return
+        dx, dy = event.x - self._drag[0], event.y - self._drag[1]
+        self._drag = (event.x, event.y)
+        ox, oy = self._origin
+        self._origin = (ox - dx / self._zoom, oy - dy / self._zoom)
+        self._render_viewport()
+    
+    
+    def _level(self, image, key, index):
+        """Source pyramid level ``index`` (each level half the previous)"""
+        import cv2
+        if self._levels_key != key:
+            self._levels = {0: image}
+            self._levels_key = key
+        if index not in self._levels:
+            parent = self._level(image, key, index - 1)
+            height, width = parent.shape[:2]
+            self._levels[index] = cv2.resize(
+                parent, (max(1, width // 2), max(1, height // 2)), interpolation=cv2.INTER_AREA)
+        return self._levels[index]
+    
+    
+    def _render_viewport(self):
+        """Place the tiles covering the canvas, rendering only uncached ones"""
+        image, key = self._shown
+        if self._image_id:
+            self._canvas.delete(self._image_id)
+            self._image_id = None
+        
+        zoom = self._zoom
+        if self._placed_key != (key, zoom):
+            self._clear_tiles()
+            self._placed_key = (key, zoom)
+        ox, oy = self._origin
+        height, width = image.shape[:2]
+        left, top = ox * zoom, oy * zoom
+        first_x = max(0, int(math.floor(left / TILE_SIZE)))
+        first_y = max(0, int(math.floor(top / TILE_SIZE)))
+        last_x = min(int(math.ceil(width * zoom / TILE_SIZE)),
+                     int(math.floor((left + self._width) / TILE_SIZE)) + 1)
+        last_y = min(int(math.ceil(height * zoom / TILE_SIZE)),
+                     int(math.floor((top + self._height) / TILE_SIZE)) + 1)
+        
+        visible = set()
+        for ty in range(first_y, last_y):
+            for tx in range(first_x, last_x):
+                visible.add((tx, ty))
+                x, y = tx * TILE_SIZE - left, ty * TILE_SIZE - top
+                placed = self._placed.get((tx, ty))
+                if placed is not None:
+                    self._canvas.coords(placed[0], x, y)
+                    continue
+                photo = self._tile(image, key, tx, ty)
+                if photo is not None:
+                    # Keep the PhotoImage alive while it is on the canvas
+                    item = self._canvas.create_image(x, y, anchor=tk.NW, image=photo)
+                    self._placed[(tx, ty)] = (item, photo)
+        
+        for position in list(self._placed):
+            if position not in visible:
+                self._canvas.delete(self._placed.pop(position)[0])
+    
+    
+    def _tile(self, image, key, tx, ty):
+        """PhotoImage for one tile at the current zoom, from the tile cache"""
+        import cv2
+        from PIL import Image, ImageTk
+        cache_key = (key, self._zoom, tx, ty)
+        photo = self._tile_cache.get(cache_key)
+        if photo is not None:
+            self._tile_cache.move_to_end(cache_key)
+            return photo
+        
+        # Read from the smallest pyramid level that still has enough detail
+        index = max(0, int(math.floor(math.log2(1.0 / self._zoom)))) if self._zoom < 1 else 0
+        level = self._level(image, key, index)
+        scale = self._zoom * (2 ** index)
+        level_height, level_width = level.shape[:2]
+        
+        x0, y0 = tx * TILE_SIZE, ty * TILE_SIZE
+        tile_width = min(TILE_SIZE, int(level_width * scale) - x0)
+        tile_height = min(TILE_SIZE, int(level_height * scale) - y0)
+        if tile_width <= 0 or tile_height <= 0:
+            return None
+        sx0, sy0 = int(x0 / scale), int(y0 / scale)
+        sx1 = min(level_width, max(sx0 + 1, int(math.ceil((x0 + tile_width) / scale))))
+        sy1 = min(level_height, max(sy0 + 1, int(math.ceil((y0 + tile_height) / scale))))
+        crop = level[sy0:sy1, sx0:sx1]
+        interpolation = cv2.INTER_NEAREST if scale >= 2 else cv2.INTER_AREA
+        crop = cv2.resize(crop, (tile_width, tile_height), interpolation=interpolation)
+        photo = ImageTk.PhotoImage(Image.fromarray(_to_rgb(crop)))
+        
+        self._tile_cache[cache_key] = photo
+        while len(self._tile_cache) > MAX_CACHED_TILES:
+            self._tile_cache.popitem(last=False)
+        return photo
+    
+    
+    def _clear_tiles(self):
+        for item, _ in self._placed.values():
+            self._canvas.delete(item)
+        self._placed.clear()
+        self._placed_key = None
+    
+    
+    def _on_resize(self, event):
+        """Track the canvas size and redraw the current image to fit"""
+        # The highlight border is drawn inside the reported size
+        border = 2 * int(self._canvas.cget('highlightthickness'))
+        width, height = event.width - border, event.height - border
+        if (width, height) == (self._width, self._height) or width <= 1 or height <= 1:
+            return
+        self._width, self._height = width, height
+        if self._shown is not None:
+            self.display_image(*self._shown)
+    
+    
     def clear(self):
         self._canvas.delete("all")
         self._image_id = None
         self._photo_image = None
-        self._show_placeholder()
\ No newline at end of file
+        self._shown = None
+        self._cache.clear()
+        self._pyramid = None
+        self._viewport = False
+        self._placed.clear()
+        self._placed_key = None
+        self._tile_cache.clear()
+        self._levels = {}
+        self._levels_key = None
+        self._show_placeholder()
+
+class Filmstrip:
+    """Row of history thumbnails; clicking one calls ``on_select(state key)``
+
+    Each thumbnail becomes a PhotoImage once, when it first appears, and is
+    reused until its history state is dropped.
+    """
+    
+    def __init__(self, parent, on_select, size=72):
+        self._on_select = on_select
+        self._size = size
+        self._cell = size + 12
+        self._canvas = Canvas(
+            parent,
+            height=self._cell + 4,
+            bg='#fef9f3',
+            highlightthickness=0
+        )
+        scrollbar = tk.Scrollbar(parent, orient=tk.HORIZONTAL, command=self._canvas.xview)
+        self._canvas.configure(xscrollcommand=scrollbar.set)
+        self._canvas.pack(fill=tk.X, padx=10)
+        scrollbar.pack(fill=tk.X, padx=10)
+        
+        self._photos = {}           # state key -> PhotoImage
+        self._keys = []
+        self._canvas.bind('<Button-1>', self._on_click)
+    
+    
+    def show(self, history):
+        """Draw ``history`` as returned by ImageProcessor.get_history (None clears)"""
+        self._canvas.delete("all")
+        if history is None:
+            self._photos.clear()
+            self._keys = []
+            return
+        states, position = history
+        
+        photos = {}
+        for index, (key, thumbnail) in enumerate(states):
+            x = index * self._cell + 6
+            if index == position:
+                self._canvas.create_rectangle(
+                    x - 4, 2, x + self._size + 4, self._cell,
+                    outline='#b4a5d3',
+                    width=3
+                )
+            if thumbnail is None:
+                continue
+            photo = self._photos.get(key) or self._photo(thumbnail)
+            photos[key] = photo
+            self._canvas.create_image(x + self._size // 2, self._cell // 2 + 2, image=photo)
+        # Thumbnails of states no longer in history are released here
+        self._photos = photos
+        self._keys = [key for key, _ in states]
+        
+        width = len(self._keys) * self._cell
+        self._canvas.configure(scrollregion=(0, 0, width, self._cell))
+        # Keep the current state in view
+        visible = self._canvas.winfo_width()
+        if width > visible > 1:
+            left = max(0, (position + 1) * self._cell - visible)
+            self._canvas.xview_moveto(left / width)
+    
+    
+    def _photo(self, thumbnail):
+        from PIL import Image, ImageTk
+        return ImageTk.PhotoImage(Image.fromarray(_to_rgb(thumbnail)))
+    
+    
+    def _on_click(self, event):
+        index = int(self._canvas.canvasx(event.x) // self._cell)
+        if 0 <= index < len(self._keys):
+            self._on_select(self._keys[index])
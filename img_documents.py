@@ -0,0 +1,39 @@
+import os
+
+
+class Document:
+    """One open image and its processor
+
+    Documents that are not on screen are parked: their frames are kept
+    compressed (or memory-mapped) instead of decoded, so many open files do
+    not need one decoded frame each. ``run`` unparks for the duration of an
+    operation and parks again unless the document is to stay decoded.
+    """
+
+    def __init__(self, filepath, processor):
+        self.filepath = filepath
+        self.processor = processor
+        self.modified = False
+
+    @property
+    def name(self):
+        return os.path.basename(self.filepath) if self.filepath else "Untitled"
+
+    @property
+    def parked(self):
+        return self.processor.is_parked()
+
+    def park(self):
+        self.processor.park()
+
+    def unpark(self):
+        self.processor.unpark()
+
+    def run(self, method, *args, keep_decoded=False):
+        """Call an ImageProcessor method by name, unparking around it"""
+        self.processor.unpark()
+        try:
+            return getattr(self.processor, method)(*args)
+        finally:
+            if not keep_decoded:
+                self.processor.park()
@@ -1,9 +1,13 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import os
+import tempfile
+from functools import partial
 
-from img_processor import ImageProcessor
-from img_display import ImageDisplay
+from img_display import Filmstrip, ImageDisplay, prepare
+from img_documents import Document
+from img_profiler import PROFILER
+from img_worker import JobRunner
 
 
 class ImageEditor:
@@ -30,13 +34,36 @@ class ImageEditor:
         # Configures root window
         self.root.configure(bg=self.colors['bg_dark'])
         
-        # Creates the image processor
-        self.processor = ImageProcessor()
+        # Open documents; self.processor always belongs to the active one
+        # (None until the first image is opened, so cv2 is not imported
+        # before the window shows)
+        self._backend = 'auto'
+        # Worker processes shared by every document, started with the first
+        self._processes = None
+        # Memory-mapped decodes of large images (see img_io.read_image)
+        self._cache_dir = os.path.join(tempfile.gettempdir(), 'img_editor_cache')
+        self.documents = []
+        self._active = None
+        self.processor = None
+        # Jobs of documents still loading; a new Open cancels them
+        self._loading = {}
         
         # Tracks current file
         self._current_file = ""
         self._is_modified = False
         
+        # Runs processing off the Tk thread on a bounded pool shared by all
+        # documents; progress shows in the status bar
+        self.jobs = JobRunner(self.root, max_workers=os.cpu_count() or 2,
+                              on_progress=self._on_jobs_changed)
+        self._showing_progress = False
+        
+        # Live preview state: only the latest slider value is rendered,
+        # against the proxy the last edit or show job handed over
+        self._pending_preview = None
+        self._preview_job = None
+        self._proxy = None
+        
         # Setups modern theme
         self._setup_theme()
         
@@ -133,10 +160,13 @@ class ImageEditor:
                            activebackground=self.colors['accent'],
                            activeforeground=self.colors['text_light'])
         menubar.add_cascade(label="📁 File", menu=file_menu)
-        file_menu.add_command(label="Open Image", command=self._open_image, accelerator="Ctrl+O")
+        file_menu.add_command(label="Open Image(s)", command=self._open_image, accelerator="Ctrl+O")
         file_menu.add_command(label="Save", command=self._save_image, accelerator="Ctrl+S")
         file_menu.add_command(label="Save As...", command=self._save_as, accelerator="Ctrl+Shift+S")
         file_menu.add_separator()
+        file_menu.add_command(label="Save Recipe...", command=self._save_recipe)
+        file_menu.add_command(label="Apply Recipe...", command=self._apply_recipe)
+        file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self._exit_app, accelerator="Alt+F4")
         
         # Edit menu
@@ -150,6 +180,36 @@ class ImageEditor:
         edit_menu.add_command(label="Redo", command=self._redo, accelerator="Ctrl+Y")
         edit_menu.add_separator()
         edit_menu.add_command(label="Reset to Original", command=self._reset, accelerator="Ctrl+R")
+        
+        # View menu
+        view_menu = tk.Menu(menubar, tearoff=0,
+                           bg=self.colors['bg_medium'],
+                           fg=self.colors['text_light'],
+                           activebackground=self.colors['accent'],
+                           activeforeground=self.colors['text_light'])
+        menubar.add_cascade(label="🔍 View", menu=view_menu)
+        view_menu.add_command(label="Fit to Window", command=lambda: self.display.fit_to_window())
+        view_menu.add_command(label="Actual Size (100%)", command=lambda: self.display.zoom_to(1.0))
+        view_menu.add_command(label="Zoom In", command=lambda: self._zoom_by(1.25))
+        view_menu.add_command(label="Zoom Out", command=lambda: self._zoom_by(0.8))
+        view_menu.add_separator()
+        self.profiling_var = tk.BooleanVar(value=False)
+        view_menu.add_checkbutton(label="Performance Overlay", variable=self.profiling_var,
+                                  command=self._toggle_profiling)
+        view_menu.add_command(label="Export Performance Trace...", command=self._export_trace)
+        
+        backend_menu = tk.Menu(view_menu, tearoff=0,
+                               bg=self.colors['bg_medium'],
+                               fg=self.colors['text_light'],
+                               activebackground=self.colors['accent'],
+                               activeforeground=self.colors['text_light'])
+        view_menu.add_cascade(label="Processing Backend", menu=backend_menu)
+        self.backend_var = tk.StringVar(value=self._backend)
+        # Fixed list so the menu does not import cv2; unavailable ones are
+        # reported when picked
+        for name in ('auto', 'numpy', 'umat', 'reference'):
+            backend_menu.add_radiobutton(label=name, value=name, variable=self.backend_var,
+                                         command=self._set_backend)
     
     
     def _create_header(self):
@@ -201,12 +261,55 @@ class ImageEditor:
         self.main_frame = tk.Frame(self.root, bg=self.colors['bg_dark'])
         self.main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
+        # Far left: open documents
+        self._create_document_panel()
+        
         # Left side: Image display
         display_frame = tk.Frame(self.main_frame, bg=self.colors['bg_dark'])
         display_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
         # Creates the image display
         self.display = ImageDisplay(display_frame, 900, 650)
+        
+        # History thumbnails below the image; a click jumps to that state
+        self.filmstrip = Filmstrip(display_frame, self._jump_to)
+    
+    
+    def _create_document_panel(self):
+        """File list of open documents with the apply-to-all switch"""
+        docs_frame = tk.Frame(self.main_frame,
+                              bg=self.colors['bg_medium'],
+                              width=200)
+        docs_frame.pack(side=tk.LEFT, fill=tk.Y, padx=(0, 10))
+        docs_frame.pack_propagate(False)
+        
+        ttk.Label(docs_frame,
+                  text="📚 Documents",
+                  style='Section.TLabel').pack(pady=(15, 5))
+        
+        self.doc_list = tk.Listbox(docs_frame,
+                                   bg=self.colors['bg_light'],
+                                   fg=self.colors['text_light'],
+                                   selectbackground=self.colors['accent'],
+                                   selectforeground=self.colors['text_light'],
+                                   font=('Segoe UI', 10),
+                                   relief='flat',
+                                   borderwidth=0,
+                                   highlightthickness=0,
+                                   activestyle='none',
+                                   exportselection=False)
+        self.doc_list.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.doc_list.bind('<<ListboxSelect>>', self._on_document_selected)
+        
+        self.apply_all_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(docs_frame,
+                       text="Apply edits to all",
+                       variable=self.apply_all_var,
+                       bg=self.colors['bg_medium'],
+                       fg=self.colors['text_light'],
+                       activebackground=self.colors['bg_medium'],
+                       selectcolor=self.colors['bg_light'],
+                       font=('Segoe UI', 10)).pack(pady=(5, 15))
     
     
     def _create_controls(self):
@@ -259,18 +362,44 @@ class ImageEditor:
         canvas.bind_all("<MouseWheel>", _on_mousewheel)
         
         
+        # The window shows first; sections are then built one per timer
+        # tick so the first frame and input are never held up
+        self._pending_sections = [
+            self._build_filter_section,
+            self._build_blur_section,
+            self._build_brightness_section,
+            self._build_contrast_section,
+            self._build_gamma_section,
+            self._build_rotation_section,
+            self._build_flip_section,
+            self._build_scale_section,
+        ]
+        self.root.after(1, self._build_next_section, scroll_frame)
+    
+    
+    def _build_next_section(self, parent):
+        """Build one deferred control section, then queue the next"""
+        if self._pending_sections:
+            self._pending_sections.pop(0)(parent)
+        if self._pending_sections:
+            self.root.after(1, self._build_next_section, parent)
+    
+    
+    def _build_filter_section(self, parent):
         # Basic Filters Section
-        self._add_section(scroll_frame, "🎨 Basic Filters")
+        self._add_section(parent, "🎨 Basic Filters")
         
-        filter_frame = self._create_card(scroll_frame)
+        filter_frame = self._create_card(parent)
         
         self._create_styled_button(filter_frame, "Grayscale", self._apply_grayscale, "⚫")
         self._create_styled_button(filter_frame, "Edge Detection", self._apply_edges, "🔲")
-        
+    
+    
+    def _build_blur_section(self, parent):
         # Blur Section
-        self._add_section(scroll_frame, "💫 Blur Effect")
+        self._add_section(parent, "💫 Blur Effect")
         
-        blur_card = self._create_card(scroll_frame)
+        blur_card = self._create_card(parent)
         
         self.blur_var = tk.IntVar(value=5)
         
@@ -289,14 +418,17 @@ class ImageEditor:
         blur_slider = ttk.Scale(blur_card, from_=1, to=25,
                                orient=tk.HORIZONTAL, variable=self.blur_var)
         blur_slider.pack(pady=5, padx=10, fill=tk.X)
-        blur_slider.config(command=lambda v: self.blur_label.config(text=f"{int(float(v))}"))
+        blur_slider.config(command=lambda v: self._on_slider(self.blur_label, f"{int(float(v))}",
+                                                             'blur', intensity=int(float(v))))
         
         self._create_styled_button(blur_card, "Apply Blur", self._apply_blur, "💫")
-        
+    
+    
+    def _build_brightness_section(self, parent):
         # Brightness Section
-        self._add_section(scroll_frame, "☀️ Brightness")
+        self._add_section(parent, "☀️ Brightness")
         
-        bright_card = self._create_card(scroll_frame)
+        bright_card = self._create_card(parent)
         
         self.brightness_var = tk.IntVar(value=0)
         
@@ -315,14 +447,17 @@ class ImageEditor:
         brightness_slider = ttk.Scale(bright_card, from_=-100, to=100,
                                      orient=tk.HORIZONTAL, variable=self.brightness_var)
         brightness_slider.pack(pady=5, padx=10, fill=tk.X)
-        brightness_slider.config(command=lambda v: self.brightness_label.config(text=f"{int(float(v))}"))
+        brightness_slider.config(command=lambda v: self._on_slider(self.brightness_label, f"{int(float(v))}",
+                                                                   'brightness', value=int(float(v))))
         
         self._create_styled_button(bright_card, "Apply Brightness", self._apply_brightness, "☀️")
-        
+    
+    
+    def _build_contrast_section(self, parent):
         # Contrast Section
-        self._add_section(scroll_frame, "◐ Contrast")
+        self._add_section(parent, "◐ Contrast")
         
-        contrast_card = self._create_card(scroll_frame)
+        contrast_card = self._create_card(parent)
         
         self.contrast_var = tk.DoubleVar(value=1.0)
         
@@ -341,14 +476,46 @@ class ImageEditor:
         contrast_slider = ttk.Scale(contrast_card, from_=0.5, to=3.0,
                                    orient=tk.HORIZONTAL, variable=self.contrast_var)
         contrast_slider.pack(pady=5, padx=10, fill=tk.X)
-        contrast_slider.config(command=lambda v: self.contrast_label.config(text=f"{float(v):.1f}"))
+        contrast_slider.config(command=lambda v: self._on_slider(self.contrast_label, f"{float(v):.1f}",
+                                                                 'contrast', value=float(v)))
         
         self._create_styled_button(contrast_card, "Apply Contrast", self._apply_contrast, "◐")
+    
+    
+    def _build_gamma_section(self, parent):
+        # Gamma Section
+        self._add_section(parent, "🌗 Gamma")
+        
+        gamma_card = self._create_card(parent)
+        
+        self.gamma_var = tk.DoubleVar(value=1.0)
         
+        gamma_label_frame = tk.Frame(gamma_card, bg=self.colors['bg_light'])
+        gamma_label_frame.pack(fill=tk.X, pady=(0, 5))
+        
+        ttk.Label(gamma_label_frame, text="Gamma:",
+                 background=self.colors['bg_light']).pack(side=tk.LEFT)
+        
+        self.gamma_label = ttk.Label(gamma_label_frame, text="1.0",
+                                     foreground=self.colors['accent_bright'],
+                                     background=self.colors['bg_light'],
+                                     font=('Segoe UI', 10, 'bold'))
+        self.gamma_label.pack(side=tk.RIGHT)
+        
+        gamma_slider = ttk.Scale(gamma_card, from_=0.2, to=3.0,
+                                orient=tk.HORIZONTAL, variable=self.gamma_var)
+        gamma_slider.pack(pady=5, padx=10, fill=tk.X)
+        gamma_slider.config(command=lambda v: self._on_slider(self.gamma_label, f"{float(v):.1f}",
+                                                              'gamma', value=float(v)))
+        
+        self._create_styled_button(gamma_card, "Apply Gamma", self._apply_gamma, "🌗")
+    
+    
+    def _build_rotation_section(self, parent):
         # Rotation Section
-        self._add_section(scroll_frame, "🔄 Rotation")
+        self._add_section(parent, "🔄 Rotation")
         
-        rotation_card = self._create_card(scroll_frame)
+        rotation_card = self._create_card(parent)
         
         rotation_frame = tk.Frame(rotation_card, bg=self.colors['bg_light'])
         rotation_frame.pack(pady=5, fill=tk.X)
@@ -356,22 +523,26 @@ class ImageEditor:
         self._create_compact_button(rotation_frame, "90°", lambda: self._rotate(90)).pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
         self._create_compact_button(rotation_frame, "180°", lambda: self._rotate(180)).pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
         self._create_compact_button(rotation_frame, "270°", lambda: self._rotate(270)).pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
-        
+    
+    
+    def _build_flip_section(self, parent):
         # Flip Section
-        self._add_section(scroll_frame, "🔃 Flip")
+        self._add_section(parent, "🔃 Flip")
         
-        flip_card = self._create_card(scroll_frame)
+        flip_card = self._create_card(parent)
         
         flip_frame = tk.Frame(flip_card, bg=self.colors['bg_light'])
         flip_frame.pack(pady=5, fill=tk.X)
         
         self._create_compact_button(flip_frame, "↔️ Horizontal", lambda: self._flip('horizontal')).pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
         self._create_compact_button(flip_frame, "↕️ Vertical", lambda: self._flip('vertical')).pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
-        
+    
+    
+    def _build_scale_section(self, parent):
         # Scale Section
-        self._add_section(scroll_frame, "📏 Resize / Scale")
+        self._add_section(parent, "📏 Resize / Scale")
         
-        scale_card = self._create_card(scroll_frame)
+        scale_card = self._create_card(parent)
         
         self.scale_var = tk.IntVar(value=100)
         
@@ -390,7 +561,8 @@ class ImageEditor:
         scale_slider = ttk.Scale(scale_card, from_=25, to=200,
                                 orient=tk.HORIZONTAL, variable=self.scale_var)
         scale_slider.pack(pady=5, padx=10, fill=tk.X)
-        scale_slider.config(command=lambda v: self.scale_label.config(text=f"{int(float(v))}%"))
+        scale_slider.config(command=lambda v: self._on_slider(self.scale_label, f"{int(float(v))}%",
+                                                              'scale', percent=int(float(v))))
         
         self._create_styled_button(scale_card, "Apply Scale", self._apply_scale, "📏")
     
@@ -496,12 +668,23 @@ class ImageEditor:
                                      font=('Segoe UI', 10),
                                      anchor=tk.W)
         self.status_label.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        
+        # Per-stage timing of the last action (View → Performance Overlay)
+        self.timing_label = tk.Label(self.status_bar,
+                                     text="",
+                                     fg=self.colors['text_medium'],
+                                     bg=self.colors['bg_medium'],
+                                     font=('Segoe UI', 9),
+                                     anchor=tk.E)
+        self.timing_label.pack(side=tk.RIGHT, padx=10)
     
     
     def _update_status(self, message=None, status='ready'):
         """Update the status bar with current image info"""
         if message:
             text = message
+        elif self.processor is None:
+            text = "Ready | No image loaded"
         else:
             info = self.processor.get_image_info()
             
@@ -517,54 +700,179 @@ class ImageEditor:
             self.status_icon.config(fg=self.colors['success'])
         elif status == 'warning':
             self.status_icon.config(fg=self.colors['warning'])
+        elif status == 'busy':
+            self.status_icon.config(fg=self.colors['accent_bright'])
         else:
             self.status_icon.config(fg=self.colors['accent'])
         
         self.status_label.config(text=text)
     
     
+    def _new_processor(self):
+        from img_processor import ImageProcessor
+        from img_shared import ProcessRunner
+        if self._processes is None:
+            self._processes = ProcessRunner(max_workers=os.cpu_count())
+        return ImageProcessor(
+            cache_dir=self._cache_dir,
+            backend=self._backend,
+            processes=self._processes)
+    
+    
     def _open_image(self):
-        """Open an image file"""
+        """Open one or more image files as documents"""
         filetypes = (
-            ('All Images', '*.jpg *.jpeg *.png *.bmp *.gif'),
+            ('All Images', '*.jpg *.jpeg *.png *.bmp *.gif *.tif *.tiff'),
             ('JPEG files', '*.jpg *.jpeg'),
             ('PNG files', '*.png'),
             ('All files', '*.*')
         )
         
-        filepath = filedialog.askopenfilename(
-            title="Open Image",
+        filepaths = filedialog.askopenfilenames(
+            title="Open Image(s)",
             filetypes=filetypes
         )
         
-        if filepath:
-            if self.processor.load_image(filepath):
-                self._current_file = filepath
-                self._is_modified = False
-                self._refresh_display()
+        if filepaths:
+            # Opening other files supersedes loads still in progress
+            for document in list(self._loading):
+                self._close_document(document)
+            if not self.documents:
+                # Measure the kernel backends while the first images load
+                # rather than on the first edit
+                import img_backends
+                self.jobs.submit(img_backends.auto_backend)
+            for index, filepath in enumerate(filepaths):
+                document = Document(filepath, self._new_processor())
+                self.documents.append(document)
+                self._load_document(document, preview=index == len(filepaths) - 1)
+            self._activate(self.documents[-1])
+    
+    
+    def _load_document(self, document, preview=False):
+        """Decode a document on its lane; documents not on screen are parked
+
+        With ``preview``, a reduced-resolution decode of a large file is
+        shown while the full decode runs.
+        """
+        import img_io
+        
+        def load():
+            if not document.processor.load_image(document.filepath):
+                return False
+            if document is not self._active:
+                document.park()
+            return True
+        
+        def done(success):
+            self._loading.pop(document, None)
+            if success:
                 self._update_status(status='success')
-                messagebox.showinfo("Success", "Image loaded successfully!")
             else:
+                self._close_document(document)
                 self._update_status("Failed to load image", status='warning')
-                messagebox.showerror("Error", "Failed to load image")
+                messagebox.showerror("Error", f"Failed to load {document.name}")
+        
+        def show_preview(result):
+            # Too late once the full image is in
+            if result is not None and document is self._active and document in self._loading:
+                image, (width, height) = result
+                self.display.display_preview(image, width, height)
+        
+        jobs = [self.jobs.submit(load, on_done=done, on_error=self._on_job_error, lane=document)]
+        if preview:
+            # Not on the lane, so it runs alongside the full decode
+            jobs.append(self.jobs.submit(img_io.read_preview, document.filepath,
+                                         self._cache_dir, on_done=show_preview))
+        self._loading[document] = jobs
+    
+    
+    def _activate(self, document):
+        """Make a document the one shown and edited"""
+        previous = self._active
+        if previous is document:
+            return
+        if previous is not None:
+            previous.filepath = self._current_file
+            previous.modified = self._is_modified
+            self.jobs.submit(previous.park, lane=previous)
+        
+        self._active = document
+        self.processor = document.processor if document else None
+        self._proxy = None
+        self._current_file = document.filepath if document else ""
+        self._is_modified = document.modified if document else False
+        self._refresh_document_list()
+        
+        if document is None:
+            self.display.clear()
+            self.filmstrip.show(None)
+            self._update_status()
+            return
+        
+        size = self.display.get_size()
+        
+        def show():
+            document.unpark()
+            processor = document.processor
+            image = processor.get_current_image()
+            prepared = prepare(image, size) if image is not None else None
+            return (image, processor.get_state_key(), processor.get_history(),
+                    processor.get_proxy(*size), prepared)
+        
+        def done(result):
+            if document is self._active:
+                image, key, history, self._proxy, prepared = result
+                self._show(image, key, prepared)
+                self.filmstrip.show(history)
+                self._update_status()
+        
+        self.jobs.submit(show, on_done=done, on_error=self._on_job_error, lane=document)
+    
+    
+    def _close_document(self, document):
+        if document not in self.documents:
+            return
+        # A decode already running finishes, but its result is dropped
+        for job in self._loading.pop(document, ()):
+            job.cancel()
+        index = self.documents.index(document)
+        self.documents.remove(document)
+        if document is self._active:
+            self._active = None
+            remaining = self.documents[min(index, len(self.documents) - 1)] if self.documents else None
+            self._activate(remaining)
+        self._refresh_document_list()
+    
+    
+    def _on_document_selected(self, event):
+        selection = self.doc_list.curselection()
+        if selection and selection[0] < len(self.documents):
+            self._activate(self.documents[selection[0]])
+    
+    
+    def _refresh_document_list(self):
+        """Redraw the file list; modified documents are marked with a dot"""
+        self.doc_list.delete(0, tk.END)
+        for document in self.documents:
+            modified = self._is_modified if document is self._active else document.modified
+            self.doc_list.insert(tk.END, f"{'● ' if modified else ''}{document.name}")
+        if self._active in self.documents:
+            index = self.documents.index(self._active)
+            self.doc_list.selection_set(index)
+            self.doc_list.see(index)
     
     
-    def _save_image(self):
+    def _save_image(self, then=None):
         """Save the current image"""
         if not self._current_file:
-            self._save_as()
+            self._save_as(then)
             return
         
-        if self.processor.save_image(self._current_file):
-            self._is_modified = False
-            self._update_status(status='success')
-            messagebox.showinfo("Success", "Image saved successfully!")
-        else:
-            self._update_status("Failed to save image", status='warning')
-            messagebox.showerror("Error", "Failed to save image")
+        self._save_to(self._current_file, then)
     
     
-    def _save_as(self):
+    def _save_as(self, then=None):
         """Save with a new filename"""
         filetypes = (
             ('PNG files', '*.png'),
@@ -579,129 +887,352 @@ class ImageEditor:
         )
         
         if filepath:
-            if self.processor.save_image(filepath):
-                self._current_file = filepath
-                self._is_modified = False
+            self._save_to(filepath, then)
+    
+    
+    def _save_to(self, filepath, then=None, document=None):
+        """Save a document (the active one by default) on its lane;
+        ``then`` runs after a successful save"""
+        document = document or self._active
+        if document is None:
+            return
+        
+        def done(success):
+            if success:
+                document.filepath = filepath
+                document.modified = False
+                if document is self._active:
+                    self._current_file = filepath
+                    self._is_modified = False
+                self._refresh_document_list()
                 self._update_status(status='success')
                 messagebox.showinfo("Success", "Image saved successfully!")
+                if then is not None:
+                    then()
             else:
                 self._update_status("Failed to save image", status='warning')
                 messagebox.showerror("Error", "Failed to save image")
+        
+        # The visible document stays decoded; others are parked again
+        save = partial(document.run, 'save_image', filepath,
+                       keep_decoded=document is self._active)
+        self.jobs.submit(save, on_done=done, on_error=self._on_job_error, lane=document)
+    
+    
+    def _save_recipe(self):
+        """Save the edits made to the current image as a recipe file"""
+        if self.processor is None:
+            messagebox.showwarning("Warning", "No edits to save as a recipe")
+            return
+        recipe = self.processor.get_recipe()
+        if not len(recipe):
+            messagebox.showwarning("Warning", "No edits to save as a recipe")
+            return
+        filepath = filedialog.asksaveasfilename(
+            title="Save Recipe",
+            defaultextension=".json",
+            filetypes=(('Recipe files', '*.json'), ('All files', '*.*'))
+        )
+        if filepath:
+            try:
+                recipe.save(filepath)
+                self._update_status(f"Recipe saved ({len(recipe)} steps)", status='success')
+            except OSError as error:
+                messagebox.showerror("Error", f"Failed to save recipe: {error}")
+    
+    
+    def _apply_recipe(self):
+        """Replay a saved recipe on the current image (or all documents)"""
+        filepath = filedialog.askopenfilename(
+            title="Apply Recipe",
+            filetypes=(('Recipe files', '*.json'), ('All files', '*.*'))
+        )
+        if not filepath:
+            return
+        from img_recipe import Recipe
+        try:
+            recipe = Recipe.load(filepath)
+        except (OSError, KeyError, TypeError, ValueError) as error:
+            messagebox.showerror("Error", f"Not a valid recipe: {error}")
+            return
+        self._run_edit('apply_recipe', recipe)
     
     
     def _exit_app(self):
         """Exit the application"""
-        if self._is_modified:
+        unsaved = [d for d in self.documents
+                   if (self._is_modified if d is self._active else d.modified)]
+        if unsaved:
+            names = "\n".join(f"  {d.name}" for d in unsaved)
             result = messagebox.askyesnocancel(
                 "Unsaved Changes",
-                "Save changes before exiting?"
+                f"Save changes before exiting?\n\n{names}"
             )
             if result is None:
                 return
             elif result:
-                self._save_image()
+                self._save_all(unsaved, then=self._close)
+                return
         
+        self._close()
+    
+    
+    def _save_all(self, documents, then=None):
+        """Save documents one after another; a failed save stops the chain"""
+        if not documents:
+            if then is not None:
+                then()
+            return
+        document, rest = documents[0], documents[1:]
+        next_save = partial(self._save_all, rest, then)
+        if document is self._active:
+            self._save_image(then=next_save)
+        else:
+            self._save_to(document.filepath, next_save, document)
+    
+    
+    def _close(self):
+        self.jobs.shutdown()
+        if self._processes is not None:
+            self._processes.shutdown()
         self.root.destroy()
     
     
+    def _run_edit(self, method, *args, modified=True):
+        """Run a processor method (by name) on the worker pool
+
+        With "Apply edits to all" ticked every open document gets the call.
+        Each document has its own lane, so documents are processed in
+        parallel on the shared pool while one document's edits stay in order.
+        """
+        if self._active is None:
+            return
+        targets = self.documents if self.apply_all_var.get() else [self._active]
+        for document in targets:
+            self._submit_edit(document, method, args, modified)
+    
+    
+    def _submit_edit(self, document, method, args, modified):
+        visible = document is self._active
+        size = self.display.get_size()
+        
+        def edit():
+            action = PROFILER.begin_action(method) if visible else None
+            with PROFILER.activate(action):
+                # Edits return None; undo/redo return False when nothing changed
+                if document.run(method, *args, keep_decoded=visible) is False:
+                    PROFILER.end_action(action)
+                    return None
+                if not visible:
+                    return None, None, None, None, None, None
+                processor = document.processor
+                image = processor.get_current_image()
+                # The preview proxy and the display pyramid are built here, on
+                # the lane, so the Tk thread only blits
+                prepared = prepare(image, size) if image is not None else None
+                return (image, processor.get_state_key(), action, processor.get_history(),
+                        processor.get_proxy(*size), prepared)
+        
+        def done(result):
+            if result is None:
+                return
+            image, key, action, history, proxy, prepared = result
+            if document is self._active and image is not None:
+                self._proxy = proxy
+                with PROFILER.activate(action):
+                    self._show(image, key, prepared)
+                PROFILER.end_action(action)
+                self.filmstrip.show(history)
+                self._is_modified = modified
+                self._update_status()
+                self._update_timing(action)
+            else:
+                document.modified = modified
+            self._refresh_document_list()
+        
+        self.jobs.submit(edit, on_done=done, on_error=self._on_job_error, lane=document)
+        if visible:
+            # Documents kept decoded compress their history once the lane is
+            # idle; parked ones already did when they were parked
+            self.jobs.submit(document.processor.compact_history, lane=document, background=True)
+    
+    
+    def _on_job_error(self, error):
+        self._update_status(f"Processing failed: {error}", status='warning')
+    
+    
+    def _on_jobs_changed(self, active):
+        """Show progress in the status bar while jobs are running"""
+        if active:
+            plural = "s" if active > 1 else ""
+            self._update_status(f"Processing... ({active} job{plural} running)", status='busy')
+            self._showing_progress = True
+        elif self._showing_progress:
+            self._showing_progress = False
+            if self.status_label.cget('text').startswith("Processing..."):
+                self._update_status()
+    
+    
     def _undo(self):
         """Undo last action"""
-        if self.processor.undo():
-            self._refresh_display()
-            self._is_modified = True
-            self._update_status()
+        self._run_edit('undo')
+    
+    
+    def _jump_to(self, state):
+        """Go straight to a history state picked in the filmstrip"""
+        # States belong to one document's history, so this never fans out
+        if self._active is not None:
+            self._submit_edit(self._active, 'jump_to', (state,), True)
     
     
     def _redo(self):
         """Redo last undone action"""
-        if self.processor.redo():
-            self._refresh_display()
-            self._is_modified = True
-            self._update_status()
+        self._run_edit('redo')
     
     
     def _reset(self):
         """Reset to original image"""
         if messagebox.askyesno("Reset", "Reset to original image?"):
-            self.processor.reset_to_original()
-            self._refresh_display()
-            self._is_modified = False
-            self._update_status()
+            self._run_edit('reset_to_original', modified=False)
     
     
     def _apply_grayscale(self):
         """Apply grayscale filter"""
-        self.processor.convert_to_grayscale()
-        self._refresh_display()
-        self._is_modified = True
-        self._update_status()
+        self._run_edit('convert_to_grayscale')
     
     
     def _apply_blur(self):
         intensity = self.blur_var.get()
-        self.processor.apply_blur(intensity)
-        self._refresh_display()
-        self._is_modified = True
-        self._update_status()
+        self._run_edit('apply_blur', intensity)
     
     
     def _apply_edges(self):
-        self.processor.detect_edges()
-        self._refresh_display()
-        self._is_modified = True
-        self._update_status()
+        self._run_edit('detect_edges')
     
     
     def _apply_brightness(self):
         value = self.brightness_var.get()
-        self.processor.adjust_brightness(value)
-        self._refresh_display()
-        self._is_modified = True
-        self._update_status()
+        self._run_edit('adjust_brightness', value)
         self.brightness_var.set(0)
         self.brightness_label.config(text="0")
     
     
     def _apply_contrast(self):
         value = self.contrast_var.get()
-        self.processor.adjust_contrast(value)
-        self._refresh_display()
-        self._is_modified = True
-        self._update_status()
+        self._run_edit('adjust_contrast', value)
         self.contrast_var.set(1.0)
         self.contrast_label.config(text="1.0")
     
     
+    def _apply_gamma(self):
+        value = self.gamma_var.get()
+        self._run_edit('adjust_gamma', value)
+        self.gamma_var.set(1.0)
+        self.gamma_label.config(text="1.0")
+    
+    
     def _rotate(self, angle):
-        self.processor.rotate_image(angle)
-        self._refresh_display()
-        self._is_modified = True
-        self._update_status()
+        self._run_edit('rotate_image', angle)
     
     
     def _flip(self, direction):
-        self.processor.flip_image(direction)
-        self._refresh_display()
-        self._is_modified = True
-        self._update_status()
+        self._run_edit('flip_image', direction)
     
     
     def _apply_scale(self):
         percent = self.scale_var.get()
-        self.processor.scale_image(percent)
-        self._refresh_display()
-        self._is_modified = True
-        self._update_status()
+        self._run_edit('scale_image', percent)
         self.scale_var.set(100)
         self.scale_label.config(text="100%")
     
     
-    def _refresh_display(self):
-        """Refresh the display with current image"""
-        current_image = self.processor.get_current_image()
-        
-        if current_image is not None:
-            self.display.display_image(current_image)
+    def _set_backend(self):
+        """Use the chosen kernel backend for every open and future document"""
+        import img_backends
+        name = self.backend_var.get()
+        if name not in img_backends.available_backends():
+            messagebox.showwarning("Warning", f"The {name} backend is not available here")
+            self.backend_var.set(self._backend)
+            return
+        self._backend = name
+        inexact = img_backends.get_backend(name).inexact
+        for document in self.documents:
+            document.processor.set_backend(self._backend)
+        if inexact:
+            self._update_status(f"Processing backend: {self._backend} "
+                                f"({', '.join(inexact)} kept on numpy: results differed)",
+                                status='warning')
+            return
+        self._update_status(f"Processing backend: {self._backend}", status='success')
+    
+    
+    def _toggle_profiling(self):
+        """Turn hot-path timing and the status bar breakdown on or off"""
+        if self.profiling_var.get():
+            PROFILER.enable()
+            self.timing_label.config(text="Timing enabled")
+        else:
+            PROFILER.disable()
+            self.timing_label.config(text="")
+    
+    
+    def _update_timing(self, action):
+        if action is not None and PROFILER.enabled:
+            self.timing_label.config(text=action.summary())
+    
+    
+    def _export_trace(self):
+        """Save recorded timings as Chrome trace-event JSON"""
+        if not PROFILER.actions:
+            messagebox.showinfo("Performance Trace",
+                                "No timings recorded yet. Enable View → Performance Overlay first.")
+            return
+        filepath = filedialog.asksaveasfilename(
+            title="Export Performance Trace",
+            defaultextension=".json",
+            filetypes=(('Chrome trace', '*.json'), ('All files', '*.*'))
+        )
+        if filepath:
+            PROFILER.export_chrome_trace(filepath)
+            self._update_status(f"Trace saved to {os.path.basename(filepath)}", status='success')
+    
+    
+    def _zoom_by(self, factor):
+        """Zoom the viewport about the canvas centre"""
+        self.display.zoom_to(self.display.get_zoom() * factor)
+    
+    
+    def _on_slider(self, label, text, op, **params):
+        """Update a slider's value label and queue a live preview"""
+        label.config(text=text)
+        self._pending_preview = (op, params)
+        if self._preview_job is None:
+            # Coalesce drag events; only the latest value gets rendered
+            self._preview_job = self.root.after_idle(self._render_preview)
+    
+    
+    def _render_preview(self):
+        """Render the pending slider value against the display-sized proxy"""
+        self._preview_job = None
+        if self._pending_preview is None or self._proxy is None:
+            return
+        from img_processor import render_preview
+        op, params = self._pending_preview
+        self._pending_preview = None
+        self.display.display_image(render_preview(self._proxy, op, **params))
+    
+    
+    def _show(self, image, key=None, prepared=None):
+        """Display a full render of the image; ``key`` enables the display cache
+
+        ``prepared`` comes from img_display.prepare on the job that produced
+        the image.
+        """
+        # A full render supersedes any preview still queued
+        self._pending_preview = None
+        
+        if image is not None:
+            self.display.display_image(image, key, prepared)
     
     
     def run(self):
@@ -0,0 +1,167 @@
+import itertools
+from collections import OrderedDict
+
+from img_buffer import freeze
+import img_ops
+from img_tone import TonePipeline
+
+
+_state_ids = itertools.count(1)
+
+
+class OpNode:
+    """A recorded operation; holds its evaluated result once computed"""
+
+    __slots__ = ('op', 'params', 'result', 'state_id')
+
+    def __init__(self, op, params):
+        self.state_id = next(_state_ids)
+        self.op = op
+        self.params = params
+        self.result = None
+
+
+def fuse(nodes):
+    """Group a run of nodes into stages that each cost one pass over the image
+
+    Adjacent tone ops (brightness, contrast, gamma, ...) become one lookup table and adjacent
+    rotations/flips/resizes become one transform with a single resample.
+    Returns a list of ``(last_node, apply)`` pairs.
+    """
+    stages = []
+    i = 0
+    while i < len(nodes):
+        node = nodes[i]
+        j = i + 1
+        if node.op in img_ops.TONE_OPS:
+            while j < len(nodes) and nodes[j].op in img_ops.TONE_OPS:
+                j += 1
+            pipeline = TonePipeline((n.op, n.params) for n in nodes[i:j])
+            stages.append((nodes[j - 1], pipeline.apply))
+        elif node.op in img_ops.TRANSFORM_OPS:
+            while j < len(nodes) and nodes[j].op in img_ops.TRANSFORM_OPS:
+                j += 1
+            steps = [(n.op, n.params) for n in nodes[i:j]]
+            stages.append((nodes[j - 1], lambda image, s=steps: img_ops.transform(image, s)))
+        else:
+            kernel = img_ops.OPS[node.op]
+            stages.append((node, lambda image, k=kernel, p=node.params: k(image, **p)))
+        i = j
+    return stages
+
+
+class OperationGraph:
+    """Non-destructive edit chain over an immutable source image
+
+    Operations are only recorded; ``evaluate`` replays the chain from the
+    nearest cached result, fusing adjacent ops. The source is never touched,
+    and a resize or scale replays its whole transform run from the run's
+    input even when a result inside the run is cached, so a downscale
+    followed by an upscale still starts from full resolution.
+    Undo and redo just move the head of the chain.
+    """
+
+    def __init__(self, source, cache_size=4):
+        self.source = source
+        self.cache_size = cache_size
+        self._nodes = []
+        self._head = 0
+        self._cached = OrderedDict()
+        self._base_id = next(_state_ids)
+
+    def record(self, op, params):
+        for node in self._nodes[self._head:]:
+            self._forget(node)
+        del self._nodes[self._head:]
+        self._nodes.append(OpNode(op, params))
+        self._head += 1
+
+    def reset(self):
+        """Record a return to the source image"""
+        self.record('reset', {})
+
+    def state_id(self):
+        """Id of the state at the head; stable across undo/redo back to it"""
+        if self._head == 0:
+            return ('graph', self._base_id)
+        return ('graph', self._nodes[self._head - 1].state_id)
+
+    def can_undo(self):
+        return self._head > 0
+
+    def can_redo(self):
+        return self._head < len(self._nodes)
+
+    def undo(self):
+        if not self.can_undo():
+            return False
+        self._head -= 1
+        return True
+
+    def redo(self):
+        if not self.can_redo():
+            return False
+        self._head += 1
+        return True
+
+    def evaluate(self):
+        """Return the image at the head of the chain (do not modify it)"""
+        return self._evaluate(self._head)
+
+    def _evaluate(self, end):
+        """Image after the first ``end`` nodes"""
+        start = end
+        while start > 0:
+            node = self._nodes[start - 1]
+            if node.result is not None or node.op == 'reset':
+                break
+            start -= 1
+        if self._resamples_run(start, end):
+            # Rescale from the input of the transform run, not from a cached
+            # result inside it, so the run still costs a single resample
+            while start > 0 and self._nodes[start - 1].op in img_ops.TRANSFORM_OPS:
+                start -= 1
+        if start == 0 or self._nodes[start - 1].op == 'reset':
+            image = self.source
+        elif self._nodes[start - 1].result is not None:
+            image = self._nodes[start - 1].result
+            self._cached.move_to_end(id(self._nodes[start - 1]))
+        else:
+            image = self._evaluate(start)
+        for node, apply in fuse(self._nodes[start:end]):
+            image = apply(image)
+            self._remember(node, image)
+        return image
+
+    def _resamples_run(self, start, end):
+        """Whether the nodes from ``start`` continue a transform run with a resize or scale
+
+        Rotations and flips alone are exact on the cached result: a
+        transform resamples before it orients.
+        """
+        if start == 0 or self._nodes[start - 1].op not in img_ops.TRANSFORM_OPS:
+            return False
+        for node in self._nodes[start:end]:
+            if node.op not in img_ops.TRANSFORM_OPS:
+                return False
+            if node.op not in img_ops.GEOMETRIC_OPS:
+                return True
+        return False
+
+    def drop_cache(self):
+        """Forget every evaluated result (they can be recomputed)"""
+        for node in self._cached.values():
+            node.result = None
+        self._cached.clear()
+
+    def _remember(self, node, image):
+        node.result = freeze(image)
+        self._cached[id(node)] = node
+        self._cached.move_to_end(id(node))
+        while len(self._cached) > self.cache_size:
+            _, evicted = self._cached.popitem(last=False)
+            evicted.result = None
+
+    def _forget(self, node):
+        node.result = None
+        self._cached.pop(id(node), None)
@@ -0,0 +1,380 @@
+import itertools
+import zlib
+
+import cv2
+import numpy as np
+
+from img_buffer import freeze, thaw
+
+
+# Unique ids for history states, so caches can key on "this exact state"
+_state_ids = itertools.count(1)
+
+
+# Bytes sampled to decide whether a block is worth compressing
+_SAMPLE_BYTES = 64 * 1024
+
+# Bytes packed between checks for a request to stop compressing
+_CHUNK_BYTES = 4 * 1024 * 1024
+
+
+def _delta(rows, channels):
+    """PNG "Sub" filter: each sample minus the same channel one pixel left
+
+    Neighbouring pixels of a photo are close, so the differences are small
+    numbers that Huffman coding packs about twice as well as the pixels.
+    """
+    flat = rows.reshape(rows.shape[0], -1)
+    out = np.empty_like(flat)
+    out[:, :channels] = flat[:, :channels]
+    np.subtract(flat[:, channels:], flat[:, :-channels], out=out[:, channels:])
+    return out
+
+
+def _undelta(flat, channels):
+    """Invert ``_delta`` in place (uint8 sums wrap like the differences did)"""
+    pixels = flat.reshape(flat.shape[0], -1, channels)
+    np.cumsum(pixels, axis=1, dtype=pixels.dtype, out=pixels)
+
+
+class _Region:
+    """Rectangular block of pixels taken from one history state
+
+    A block covering the whole frame is kept as a reference to the frame,
+    frozen, so recording a global edit copies nothing. Smaller blocks are
+    copied, and compressed when a sample shows it pays off: a horizontal
+    delta filter followed by zlib's Huffman-only mode, which on photos
+    packs better than plain zlib at twice its speed.
+    ``compress`` packs a raw block later, off the edit path, in chunks
+    so it can stop as soon as an edit is waiting.
+    """
+
+    def __init__(self, image, bounds, level, compress=True):
+        top, bottom, left, right = bounds
+        self.bounds = bounds
+        self.shape = (bottom - top, right - left) + image.shape[2:]
+        self.dtype = image.dtype
+        self.level = level
+        self.data = None
+        self.incompressible = False
+        if self.shape[:2] == image.shape[:2]:
+            self.block = freeze(image)
+        else:
+            self.block = image[top:bottom, left:right].copy()
+            if compress:
+                self.compress()
+
+    def compress(self, stop=None):
+        """Pack a raw block with zlib unless a sample shows it barely shrinks
+
+        ``stop()`` is checked between chunks; when it returns True the
+        block is left raw and False is returned.
+        """
+        if self.block is None or self.incompressible:
+            return True
+        row_bytes = max(1, self.block[0].nbytes)
+        sample = self._filter(self.block[:1 + _SAMPLE_BYTES // row_bytes])
+        if len(self._packer().compress(sample.data)) > 0.8 * sample.nbytes:
+            self.incompressible = True
+            return True
+        packer = self._packer()
+        chunks = []
+        rows = max(1, _CHUNK_BYTES // row_bytes)
+        for top in range(0, self.block.shape[0], rows):
+            if stop is not None and stop():
+                return False
+            chunks.append(packer.compress(self._filter(self.block[top:top + rows]).data))
+        chunks.append(packer.flush())
+        self.data = b''.join(chunks)
+        self.block = None
+        return True
+
+    def _packer(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, 15, 8, zlib.Z_HUFFMAN_ONLY)
+
+    def _filter(self, rows):
+        # Chunks of a strided view are made contiguous one at a time
+        rows = np.ascontiguousarray(rows)
+        if self.dtype != np.uint8:
+            return rows
+        return _delta(rows, self.shape[2] if len(self.shape) > 2 else 1)
+
+    @property
+    def nbytes(self):
+        return self.block.nbytes if self.block is not None else len(self.data)
+
+    def restore(self):
+        if self.block is not None:
+            return self.block
+        raw = bytearray(zlib.decompress(self.data))
+        image = np.frombuffer(raw, dtype=self.dtype).reshape(self.shape)
+        if self.dtype == np.uint8:
+            _undelta(image.reshape(self.shape[0], -1), self.shape[2] if len(self.shape) > 2 else 1)
+        return image
+
+
+class _Entry:
+    """One step of history: how to move from the previous state to the next one
+
+    A step is either a recipe (a forward/inverse pair of invertible ops such as
+    rotate or flip, storing no pixels) or a pair of regions covering only the
+    area that changed. The ``after`` region is captured lazily on the first
+    undo, so a step that was never undone costs a single region.
+    """
+
+    def __init__(self, before=None, forward=None, inverse=None, keyframe=False):
+        self.state_id = next(_state_ids)
+        self.before = before
+        self.after = None
+        self.forward = forward
+        self.inverse = inverse
+        self.keyframe = keyframe
+        # Small preview of the state this step leads to, if one was set
+        self.thumbnail = None
+
+    @property
+    def nbytes(self):
+        total = 0 if self.thumbnail is None else self.thumbnail.nbytes
+        if self.before is not None:
+            total += self.before.nbytes
+        if self.after is not None:
+            total += self.after.nbytes
+        return total
+
+
+# Edges of a frame: top row, bottom row, left column, right column
+_BORDERS = (np.s_[0], np.s_[-1], np.s_[:, 0], np.s_[:, -1])
+
+
+def _changed_bounds(before, after, arena=None):
+    """Bounding box (top, bottom, left, right) of the pixels that differ"""
+    height, width = before.shape[:2]
+    # A global edit changes every border, which already pins the box to the
+    # whole frame; that is decided from the perimeter alone
+    if all(not np.array_equal(before[border], after[border]) for border in _BORDERS):
+        return 0, height, 0, width
+    before = np.ascontiguousarray(before).reshape(height, -1)
+    after = np.ascontiguousarray(after).reshape(height, -1)
+    mask = None if arena is None else arena.take(before.shape, np.uint8)
+    mask = cv2.compare(before, after, cv2.CMP_NE, dst=mask)
+    rows = np.flatnonzero(cv2.reduce(mask, 1, cv2.REDUCE_MAX))
+    if rows.size == 0:
+        return None
+    cols = cv2.reduce(mask, 0, cv2.REDUCE_MAX).reshape(width, -1).max(axis=1)
+    cols = np.flatnonzero(cols)
+    return rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+
+def _copy_into(out, image):
+    np.copyto(out, image)
+    return out
+
+
+class HistoryStore:
+    """Undo/redo history that keeps only what each step changed
+
+    Global edits keep a reference to the frozen frame they replaced, so
+    recording, undoing and redoing them copies nothing; local edits keep the
+    changed block. Memory is bounded by ``max_bytes``; the oldest steps are
+    dropped once the stored data exceeds the budget, but at least
+    ``min_steps`` steps stay undoable whatever they cost. Undo and redo touch
+    exactly one step, so their cost does not grow with the history depth.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, compress_level=1, arena=None,
+                 min_steps=5):
+        self.max_bytes = max_bytes
+        self.min_steps = min_steps
+        self.compress_level = compress_level
+        # Optional img_buffer.BufferArena for diff masks and pasted frames
+        self.arena = arena
+        self._entries = []
+        self._index = 0
+        self._nbytes = 0
+        self._base_id = next(_state_ids)
+        self._base_thumbnail = None
+        # Set while jump walks the history, so no step is dropped mid-walk
+        self._hold_budget = False
+
+    def clear(self):
+        self._entries = []
+        self._index = 0
+        self._nbytes = 0
+        self._base_id = next(_state_ids)
+        self._base_thumbnail = None
+
+    def state_id(self):
+        """Id of the current state; stable across undo/redo back to it"""
+        if self._index == 0:
+            return ('history', self._base_id)
+        return ('history', self._entries[self._index - 1].state_id)
+
+    def position(self):
+        """Index of the current state: 0 is the oldest kept, len(self) the newest"""
+        return self._index
+
+    def set_thumbnail(self, thumbnail):
+        """Attach a small preview to the current state"""
+        if self._index == 0:
+            self._base_thumbnail = thumbnail
+            return
+        entry = self._entries[self._index - 1]
+        self._nbytes -= entry.nbytes
+        entry.thumbnail = thumbnail
+        self._nbytes += entry.nbytes
+        self._enforce_budget()
+
+    def states(self):
+        """(state id, thumbnail or None) for every kept state, oldest first"""
+        states = [(('history', self._base_id), self._base_thumbnail)]
+        states += [(('history', entry.state_id), entry.thumbnail) for entry in self._entries]
+        return states
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def can_undo(self):
+        return self._index > 0
+
+    def can_redo(self):
+        return self._index < len(self._entries)
+
+    def push(self, before, after):
+        """Record a step by diffing the previous state against the new one"""
+        if before.shape != after.shape or before.dtype != after.dtype:
+            height, width = before.shape[:2]
+            region = _Region(before, (0, height, 0, width), self.compress_level)
+            self._append(_Entry(before=region, keyframe=True))
+            return
+        bounds = _changed_bounds(before, after, self.arena)
+        region = None
+        if bounds is not None:
+            region = _Region(before, bounds, self.compress_level)
+        self._append(_Entry(before=region))
+
+    def push_recipe(self, forward, inverse):
+        """Record an invertible step by the functions that replay and revert it"""
+        self._append(_Entry(forward=forward, inverse=inverse))
+
+    def undo(self, current):
+        """Return the previous state, or None when there is nothing to undo
+
+        ``current`` may be modified in place.
+        """
+        if not self.can_undo():
+            return None
+        self._index -= 1
+        entry = self._entries[self._index]
+        if entry.inverse is not None:
+            return entry.inverse(current)
+        if entry.before is None:
+            return current
+        if entry.after is None:
+            bounds = entry.before.bounds
+            if entry.keyframe:
+                height, width = current.shape[:2]
+                bounds = (0, height, 0, width)
+            # The pre-undo frame is the redo data; nothing is compressed here
+            entry.after = _Region(current, bounds, self.compress_level, compress=False)
+            self._nbytes += entry.after.nbytes
+            self._enforce_budget()
+        if entry.keyframe:
+            return entry.before.restore()
+        return self._paste(current, entry.before)
+
+    def redo(self, current):
+        """Return the next state, or None when there is nothing to redo
+
+        ``current`` may be modified in place.
+        """
+        if not self.can_redo():
+            return None
+        entry = self._entries[self._index]
+        self._index += 1
+        if entry.forward is not None:
+            return entry.forward(current)
+        if entry.after is None:
+            return current
+        if entry.keyframe:
+            return entry.after.restore()
+        return self._paste(current, entry.after)
+
+    def compact(self, stop=None):
+        """Compress every raw region, oldest first
+
+        Whole-frame steps are recorded as raw references, so this runs
+        after edits (and before a document is parked) to fit more steps in
+        the budget. ``stop()`` is polled between chunks; returns False if
+        it cut the work short.
+        """
+        for entry in self._entries:
+            for region in (entry.before, entry.after):
+                if region is None:
+                    continue
+                before = region.nbytes
+                done = region.compress(stop)
+                self._nbytes += region.nbytes - before
+                if not done:
+                    return False
+        return True
+
+    def jump(self, current, state_id):
+        """Return the state with ``state_id`` (see states), or None if it is gone
+
+        Every step in between is undone or redone, but only by its stored
+        region: whole-frame steps just swap references and partial ones
+        paste into one buffer, so no state in between is built as a frame.
+        The budget is enforced once the walk is done, so the target cannot
+        move while it is being reached.
+        """
+        ids = [state for state, _ in self.states()]
+        if state_id not in ids:
+            return None
+        position = ids.index(state_id)
+        self._hold_budget = True
+        try:
+            while self._index > position:
+                current = self.undo(current)
+            while self._index < position:
+                current = self.redo(current)
+        finally:
+            self._hold_budget = False
+        self._enforce_budget()
+        return current
+
+    def _paste(self, image, region):
+        if region.shape[:2] == image.shape[:2]:
+            # A whole-frame region is the state itself
+            return region.restore()
+        # Shared buffers (the original, images handed to the UI) are copied first
+        if not image.flags.writeable and self.arena is not None:
+            image = _copy_into(self.arena.take_like(image), image)
+        else:
+            image = thaw(image)
+        top, bottom, left, right = region.bounds
+        image[top:bottom, left:right] = region.restore()
+        return image
+
+    def _append(self, entry):
+        # Drop the redo branch
+        for dropped in self._entries[self._index:]:
+            self._nbytes -= dropped.nbytes
+        del self._entries[self._index:]
+        self._entries.append(entry)
+        self._index += 1
+        self._nbytes += entry.nbytes
+        self._enforce_budget()
+
+    def _enforce_budget(self):
+        if self._hold_budget:
+            return
+        while self._nbytes > self.max_bytes and self._index > self.min_steps:
+            oldest = self._entries.pop(0)
+            self._nbytes -= oldest.nbytes
+            self._base_id = oldest.state_id
+            self._base_thumbnail = oldest.thumbnail
+            self._index -= 1
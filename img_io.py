@@ -0,0 +1,213 @@
+import hashlib
+import os
+import struct
+import zlib
+
+import cv2
+import numpy as np
+
+
+# Images at least this large (in bytes) use the mmap cache and streaming save
+LARGE_IMAGE_BYTES = 64 * 1024 * 1024
+# The mmap cache drops its least recently used files beyond this total
+CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# Files at least this large get a reduced-resolution preview while loading
+PREVIEW_MIN_FILE_BYTES = 4 * 1024 * 1024
+PREVIEW_FACTOR = 4
+# Only JPEG decoders can skip detail (scaled DCT) for a reduced decode;
+# for other formats it would cost as much as the full decode
+_PREVIEW_EXTENSIONS = ('.jpg', '.jpeg', '.jpe')
+
+
+def _cache_path(filepath, cache_dir):
+    stat = os.stat(filepath)
+    key = f"{os.path.abspath(filepath)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return os.path.join(cache_dir, hashlib.sha1(key.encode()).hexdigest() + '.npy')
+
+
+def _trim_cache(cache_dir, max_bytes, keep=None):
+    """Delete the least recently used cache files until the rest fit max_bytes
+
+    Entries for files that changed since they were cached are never hit
+    again, so they age out here too.
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith('.npy') and entry.path != keep:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    if keep is not None and os.path.exists(keep):
+        total += os.path.getsize(keep)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            # Still mapped on platforms that forbid deleting open files
+            continue
+        total -= size
+
+
+def read_preview(filepath, cache_dir=None, min_bytes=PREVIEW_MIN_FILE_BYTES):
+    """Quick 1/PREVIEW_FACTOR-resolution decode of a large JPEG, else None
+
+    Returns ``(image, (width, height))`` with the approximate size of the
+    full image. Files already in the mmap cache load fast enough without.
+    """
+    if os.path.splitext(filepath)[1].lower() not in _PREVIEW_EXTENSIONS:
+        return None
+    try:
+        if os.path.getsize(filepath) < min_bytes:
+            return None
+        if cache_dir is not None and os.path.exists(_cache_path(filepath, cache_dir)):
+            return None
+    except OSError:
+        return None
+    image = cv2.imread(filepath, cv2.IMREAD_REDUCED_COLOR_4)
+    if image is None:
+        return None
+    height, width = image.shape[:2]
+    return image, (width * PREVIEW_FACTOR, height * PREVIEW_FACTOR)
+
+
+def read_image(filepath, cache_dir=None, threshold=LARGE_IMAGE_BYTES,
+               cache_bytes=CACHE_MAX_BYTES):
+    """Decode an image into a read-only array
+
+    With a ``cache_dir``, large images are kept as a raw ``.npy`` file and
+    returned memory-mapped, so pages can be dropped under memory pressure
+    and reopening the same file skips decoding entirely. The cache keeps at
+    most ``cache_bytes``, dropping the least recently used files first.
+    """
+    cache_file = None
+    if cache_dir is not None:
+        cache_file = _cache_path(filepath, cache_dir)
+        if os.path.exists(cache_file):
+            try:
+                image = np.load(cache_file, mmap_mode='r')
+                # The file's mtime records when it was last used
+                os.utime(cache_file)
+                return image
+            except (OSError, ValueError):
+                pass
+
+    image = cv2.imread(filepath)
+    if image is None:
+        return None
+
+    if cache_file is not None and image.nbytes >= threshold:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.save(cache_file, image)
+            _trim_cache(cache_dir, cache_bytes, keep=cache_file)
+            return np.load(cache_file, mmap_mode='r')
+        except OSError:
+            pass
+    image.setflags(write=False)
+    return image
+
+
+def write_image(filepath, image, threshold=LARGE_IMAGE_BYTES):
+    """Save an image, streaming large PNG/TIFF output strip by strip"""
+    extension = os.path.splitext(filepath)[1].lower()
+    if image.nbytes >= threshold:
+        if extension == '.png':
+            return write_png_streaming(filepath, image)
+        # Classic TIFF offsets are 32-bit
+        if extension in ('.tif', '.tiff') and image.nbytes < 0xFFFF0000:
+            return write_tiff_streaming(filepath, image)
+    return bool(cv2.imwrite(filepath, image))
+
+
+def _strips(image, strip_rows):
+    """Yield successive RGB (or gray) row strips of a BGR/gray image"""
+    for top in range(0, image.shape[0], strip_rows):
+        strip = image[top:top + strip_rows]
+        if strip.ndim == 3:
+            strip = cv2.cvtColor(strip, cv2.COLOR_BGR2RGB)
+        yield np.ascontiguousarray(strip)
+
+
+def _png_chunk(handle, kind, data):
+    handle.write(struct.pack('>I', len(data)))
+    handle.write(kind)
+    handle.write(data)
+    handle.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind)) & 0xFFFFFFFF))
+
+
+def write_png_streaming(filepath, image, strip_rows=256, level=6):
+    """Write an 8-bit PNG without building the whole encoded image in memory"""
+    height, width = image.shape[:2]
+    channels = image.shape[2] if image.ndim == 3 else 1
+    color_type = 2 if channels == 3 else 0
+    compressor = zlib.compressobj(level)
+    with open(filepath, 'wb') as handle:
+        handle.write(b'\x89PNG\r\n\x1a\n')
+        _png_chunk(handle, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))
+        for strip in _strips(image, strip_rows):
+            # Each scanline starts with a filter-type byte (0 = none)
+            rows = np.zeros((strip.shape[0], 1 + width * channels), dtype=np.uint8)
+            rows[:, 1:] = strip.reshape(strip.shape[0], -1)
+            data = compressor.compress(rows.data)
+            if data:
+                _png_chunk(handle, b'IDAT', data)
+        _png_chunk(handle, b'IDAT', compressor.flush())
+        _png_chunk(handle, b'IEND', b'')
+    return True
+
+
+def write_tiff_streaming(filepath, image, strip_rows=64):
+    """Write an uncompressed baseline TIFF one strip at a time"""
+    height, width = image.shape[:2]
+    channels = image.shape[2] if image.ndim == 3 else 1
+    row_bytes = width * channels
+    strip_count = (height + strip_rows - 1) // strip_rows
+    counts = [min(strip_rows, height - i * strip_rows) * row_bytes for i in range(strip_count)]
+
+    short, long_ = 3, 4
+    # (tag, type, values); values longer than 4 bytes go out of line
+    tags = [
+        (256, long_, [width]),
+        (257, long_, [height]),
+        (258, short, [8] * channels),
+        (259, short, [1]),
+        (262, short, [2 if channels == 3 else 1]),
+        (273, long_, [0] * strip_count),
+        (277, short, [channels]),
+        (278, long_, [strip_rows]),
+        (279, long_, counts),
+        (284, short, [1]),
+    ]
+
+    ifd_offset = 8
+    extra_offset = ifd_offset + 2 + len(tags) * 12 + 4
+    extra_size = sum(len(v) * (2 if t == short else 4) for _, t, v in tags
+                     if len(v) * (2 if t == short else 4) > 4)
+    data_offset = extra_offset + extra_size
+    offsets = [data_offset + sum(counts[:i]) for i in range(strip_count)]
+    tags[5] = (273, long_, offsets)
+
+    ifd = struct.pack('<H', len(tags))
+    extra = b''
+    for tag, kind, values in tags:
+        packed = struct.pack('<%d%s' % (len(values), 'H' if kind == short else 'I'), *values)
+        if len(packed) <= 4:
+            ifd += struct.pack('<HHI', tag, kind, len(values)) + packed.ljust(4, b'\0')
+        else:
+            ifd += struct.pack('<HHII', tag, kind, len(values), extra_offset + len(extra))
+            extra += packed
+    ifd += struct.pack('<I', 0)
+
+    with open(filepath, 'wb') as handle:
+        handle.write(b'II' + struct.pack('<HI', 42, ifd_offset))
+        handle.write(ifd)
+        handle.write(extra)
+        for strip in _strips(image, strip_rows):
+            handle.write(strip.data)
+    return True
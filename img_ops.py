@@ -0,0 +1,303 @@
+import cv2
+import numpy as np
+
+from img_tone import TonePipeline
+
+
+ROTATE_CODES = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
+
+FLIP_CODES = {
+    'horizontal': 1,
+    'vertical': 0,
+}
+
+
+# Every kernel writes into ``out`` when given an array of the result's
+# shape and dtype (see output_shape) instead of allocating one. Images are
+# BGR (h, w, 3) or single-channel (h, w); grayscale and edges return the
+# latter and every other op keeps the channel count it is given.
+
+# Ops whose result is single-channel
+GRAY_OPS = ('grayscale', 'edges')
+
+
+def _copy_into(out, image):
+    np.copyto(out, image)
+    return out
+
+
+def _is_gray(image):
+    # cv2.UMat inputs (see img_backends) are always BGR
+    return isinstance(image, np.ndarray) and image.ndim == 2
+
+
+def grayscale(image, out=None):
+    if _is_gray(image):
+        return image.copy() if out is None else _copy_into(out, image)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=out)
+
+
+def blur(image, intensity, out=None):
+    return cv2.GaussianBlur(image, (intensity, intensity), 0, dst=out)
+
+
+def edges(image, out=None):
+    if not _is_gray(image):
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.Canny(image, 100, 200, edges=out)
+
+
+def brightness(image, value, out=None):
+    return cv2.convertScaleAbs(image, dst=out, alpha=1, beta=value)
+
+
+def contrast(image, value, out=None):
+    return cv2.convertScaleAbs(image, dst=out, alpha=value, beta=0)
+
+
+def gamma(image, value, out=None):
+    return TonePipeline().add('gamma', value=value).apply(image, out)
+
+
+def levels(image, out=None, **params):
+    return TonePipeline().add('levels', **params).apply(image, out)
+
+
+def curve(image, points, channel=None, out=None):
+    return TonePipeline().add('curve', points=points, channel=channel).apply(image, out)
+
+
+def tone(image, steps, out=None):
+    return TonePipeline(steps).apply(image, out)
+
+
+def rotate(image, angle, out=None):
+    return cv2.rotate(image, ROTATE_CODES[angle], dst=out)
+
+
+def flip(image, direction, out=None):
+    return cv2.flip(image, FLIP_CODES[direction], dst=out)
+
+
+def resize(image, width, height, out=None):
+    return cv2.resize(image, (width, height), dst=out)
+
+
+def scale(image, percent, out=None):
+    height, width = image.shape[:2]
+    return resize(image, max(1, int(width * percent / 100)), max(1, int(height * percent / 100)), out)
+
+
+# Operation name -> kernel(image, **params) returning a new image
+OPS = {
+    'grayscale': grayscale,
+    'blur': blur,
+    'edges': edges,
+    'brightness': brightness,
+    'contrast': contrast,
+    'gamma': gamma,
+    'levels': levels,
+    'curve': curve,
+    'tone': tone,
+    'rotate': rotate,
+    'flip': flip,
+    'resize': resize,
+    'scale': scale,
+}
+
+# Per-pixel ops that can be folded into a single lookup table
+TONE_OPS = ('brightness', 'contrast', 'gamma', 'levels', 'curve', 'tone')
+
+# Ops that only permute pixels and compose into one of the 8 orientations
+GEOMETRIC_OPS = ('rotate', 'flip')
+
+# Ops that change the pixel grid; any run of them collapses into one Transform
+TRANSFORM_OPS = GEOMETRIC_OPS + ('resize', 'scale')
+
+# Images at least this large (width * height) are split across threads or
+# worker processes; smaller ones run faster in a single call
+PARALLEL_MIN_PIXELS = 4_000_000
+
+
+def output_shape(op, params, shape):
+    """Shape of ``op``'s result for an input of ``shape``"""
+    if op == 'recipe':
+        for step, step_params in params['steps']:
+            shape = output_shape(step, step_params, shape)
+        return shape
+    if op in TRANSFORM_OPS:
+        transform = Transform(shape[1], shape[0]).then(op, params)
+        return (transform.height, transform.width) + tuple(shape[2:])
+    if op in GRAY_OPS:
+        return tuple(shape[:2])
+    if len(shape) == 2 and op in TONE_OPS and TonePipeline([(op, params)]).needs_color():
+        return tuple(shape) + (3,)
+    return tuple(shape)
+
+
+def inverse(op, params):
+    """Return the (op, params) that undoes an invertible op, or None"""
+    if op == 'rotate':
+        return 'rotate', {'angle': 360 - params['angle']}
+    if op == 'flip':
+        return 'flip', dict(params)
+    return None
+
+
+class Orientation:
+    """One of the 8 dihedral transforms of the pixel grid
+
+    Stored as an optional horizontal flip followed by ``turns`` clockwise
+    quarter turns, so any run of rotations and flips collapses into one.
+    """
+
+    __slots__ = ('turns', 'flipped')
+
+    def __init__(self, turns=0, flipped=False):
+        self.turns = turns % 4
+        self.flipped = flipped
+
+    def __eq__(self, other):
+        return (self.turns, self.flipped) == (other.turns, other.flipped)
+
+    def __repr__(self):
+        return f"Orientation(turns={self.turns}, flipped={self.flipped})"
+
+    def is_identity(self):
+        return self.turns == 0 and not self.flipped
+
+    def then(self, op, params):
+        """Return the orientation after applying one more rotate/flip"""
+        if op == 'rotate':
+            return Orientation(self.turns + params['angle'] // 90, self.flipped)
+        if params['direction'] == 'horizontal':
+            return Orientation(-self.turns, not self.flipped)
+        # A vertical flip is a horizontal flip followed by a half turn
+        return Orientation(2 - self.turns, not self.flipped)
+
+    def apply(self, image):
+        """Apply the orientation with a single pass over the pixels"""
+        if not self.flipped:
+            if self.turns == 0:
+                return image
+            return cv2.rotate(image, ROTATE_CODES[self.turns * 90])
+        if self.turns == 0:
+            return cv2.flip(image, 1)
+        if self.turns == 2:
+            return cv2.flip(image, 0)
+        if self.turns == 3:
+            return cv2.transpose(image)
+        # Anti-transpose has no single cv2 call; copy it out of a strided view
+        return np.ascontiguousarray(self.view(image))
+
+    def view(self, image):
+        """The orientation as a zero-copy strided view of ``image``"""
+        if self.flipped:
+            image = image[:, ::-1]
+        return np.rot90(image, -self.turns)
+
+
+class Transform:
+    """An accumulated run of rotations, flips, resizes and scales
+
+    Quarter turns, flips and axis-aligned scaling compose into one
+    orientation plus one output size, so the whole run costs a single
+    resample from its input, however many times the user rescaled.
+    """
+
+    __slots__ = ('orientation', 'width', 'height')
+
+    def __init__(self, width, height):
+        self.orientation = Orientation()
+        # Output size, in the output frame
+        self.width = width
+        self.height = height
+
+    @classmethod
+    def of(cls, image, steps=()):
+        transform = cls(image.shape[1], image.shape[0])
+        for op, params in steps:
+            transform.then(op, params)
+        return transform
+
+    def then(self, op, params):
+        """Append one transform op (in place); returns self"""
+        if op in GEOMETRIC_OPS:
+            self.orientation = self.orientation.then(op, params)
+            if op == 'rotate' and params['angle'] != 180:
+                self.width, self.height = self.height, self.width
+        elif op == 'resize':
+            self.width, self.height = params['width'], params['height']
+        elif op == 'scale':
+            self.width = max(1, int(self.width * params['percent'] / 100))
+            self.height = max(1, int(self.height * params['percent'] / 100))
+        else:
+            raise ValueError(f"Not a transform operation: {op}")
+        return self
+
+    def apply(self, image):
+        """Resample once, then orient
+
+        Resampling always comes first, so appending a rotation or flip to a
+        transform gives exactly the previous result rotated or flipped.
+        """
+        width, height = self.width, self.height
+        if self.orientation.turns % 2:
+            width, height = height, width
+        if (width, height) != (image.shape[1], image.shape[0]):
+            image = resize(image, width, height)
+        return self.orientation.apply(image)
+
+    def view(self, image, resample=resize):
+        """Like ``apply``, but orient as a strided view (no copy without a resample)
+
+        ``resample(image, width, height)`` may replace the default resize.
+        """
+        width, height = self.width, self.height
+        if self.orientation.turns % 2:
+            width, height = height, width
+        if (width, height) != (image.shape[1], image.shape[0]):
+            image = resample(image, width, height)
+        return self.orientation.view(image)
+
+
+def transform(image, steps):
+    """Apply a run of transform ops with a single resample"""
+    return Transform.of(image, steps).apply(image)
+
+
+def shrink(image, width, height):
+    """Area-average ``image`` down to ``width`` x ``height``
+
+    Halves with OpenCV's 2x2 area fast path while the image is at least
+    twice the target, then finishes with one fractional INTER_AREA step:
+    the same box filtering as a single INTER_AREA resize (no aliasing) at
+    a fraction of the cost on large frames. A rotated or flipped view is
+    resampled in its memory order and re-oriented once it is small.
+    """
+    # Undo the view's transpose and flips so the resize reads memory in order
+    reorient = []
+    if abs(image.strides[1]) > abs(image.strides[0]):
+        image = image.swapaxes(0, 1)
+        width, height = height, width
+        reorient.append(lambda small: small.swapaxes(0, 1))
+    if image.strides[0] < 0:
+        image = image[::-1]
+        reorient.append(lambda small: small[::-1])
+    if image.strides[1] < 0:
+        image = image[:, ::-1]
+        reorient.append(lambda small: small[:, ::-1])
+
+    while image.shape[1] >= 2 * width and image.shape[0] >= 2 * height:
+        # The fast path needs exact multiples; the cropped edge is one pixel at most
+        rows, cols = image.shape[0] // 2, image.shape[1] // 2
+        image = cv2.resize(image[:2 * rows, :2 * cols], (cols, rows), interpolation=cv2.INTER_AREA)
+    if (image.shape[1], image.shape[0]) != (width, height):
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+    for step in reversed(reorient):
+        image = step(image)
+    return np.ascontiguousarray(image)
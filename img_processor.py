@@ -1,83 +1,552 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
 
+from img_buffer import BufferArena, freeze, pack, unpack
+import img_backends
+import img_io
+import img_ops
+from img_profiler import stage
+from img_graph import OperationGraph
+from img_history import HistoryStore
+from img_recipe import Recipe
+
+
+class TileEngine:
+    """Runs an op strip-by-strip across a thread pool
+
+    Each strip spans the full width and is padded with ``halo`` rows above
+    and below (the kernel radius), so a neighbourhood op sees exactly the
+    pixels it would see on the whole image and the result is bit-identical.
+    Results land in a preallocated output buffer; only strip-sized
+    temporaries are created. OpenCV releases the GIL, so strips run in parallel.
+    """
+
+    def __init__(self, max_workers=None, strip_rows=256, min_pixels=img_ops.PARALLEL_MIN_PIXELS):
+        self.strip_rows = strip_rows
+        self.min_pixels = min_pixels
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def should_tile(self, image):
+        return image.shape[0] * image.shape[1] >= self.min_pixels
+
+    def run(self, image, fn, halo=0, out=None):
+        """Apply ``fn(strip, dst)`` to every strip and return the output
+
+        With ``halo == 0`` the op is pointwise and ``dst`` is the output
+        slice to write into; otherwise ``dst`` is None and ``fn`` returns
+        the padded strip result. ``out`` defaults to an array like ``image``.
+        """
+        if out is None:
+            out = np.empty_like(image)
+        height = image.shape[0]
+
+        def work(top):
+            bottom = min(top + self.strip_rows, height)
+            if halo == 0:
+                fn(image[top:bottom], out[top:bottom])
+                return
+            start = max(0, top - halo)
+            stop = min(height, bottom + halo)
+            result = fn(image[start:stop], None)
+            out[top:bottom] = result[top - start:bottom - start]
+
+        for _ in self._pool.map(work, range(0, height, self.strip_rows)):
+            pass
+        return out
+
+
+def _tiled_blur(engine, image, intensity, out=None):
+    return engine.run(
+        image,
+        lambda strip, dst: cv2.GaussianBlur(strip, (intensity, intensity), 0, dst=dst),
+        halo=intensity // 2,
+        out=out,
+    )
+
+
+def _tiled_edges(engine, image, out=None):
+    gray = image
+    if image.ndim == 3:
+        gray = engine.run(
+            image,
+            lambda strip, dst: cv2.cvtColor(strip, cv2.COLOR_BGR2GRAY, dst=dst),
+            out=np.empty(image.shape[:2], dtype=np.uint8),
+        )
+    # Hysteresis can follow an edge across the whole frame, so Canny itself
+    # cannot be tiled without changing the result; OpenCV threads it internally
+    return cv2.Canny(gray, 100, 200, edges=out)
+
+
+# Ops with a tiled implementation for large images
+_TILED_OPS = {
+    'blur': _tiled_blur,
+    'edges': _tiled_edges,
+}
+
+# One strip pool shared by every processor; its threads start on first use
+_TILES = TileEngine()
+
+# Longest edge of the history thumbnails
+THUMBNAIL_SIZE = 72
+
+# Frames of the document's size the buffer arena keeps idle: an edit's
+# output, a pasted undo frame and a diff mask in flight at once
+ARENA_FRAMES = 3
+
+
+def _downsample(image, ratio):
+    """Area-downsample by ``ratio`` (<= 1), see img_ops.shrink
+
+    Every source pixel is averaged in (decimating first would alias fine
+    detail), and strided views are never copied whole.
+    """
+    height, width = image.shape[:2]
+    return img_ops.shrink(image, max(1, int(width * ratio)), max(1, int(height * ratio)))
+
+
+def thumbnail(image, size=THUMBNAIL_SIZE):
+    """Area-downsampled copy fitting ``size`` x ``size``"""
+    height, width = image.shape[:2]
+    return _downsample(image, min(1.0, size / max(height, width)))
+
+
+def render_preview(proxy, op, **params):
+    """Render an op against a ``(image, ratio)`` proxy from ImageProcessor.get_proxy
+
+    Uses no processor state, so it is safe on the Tk thread while jobs
+    edit the processor.
+    """
+    image, ratio = proxy
+    if op == 'blur':
+        # Shrink the kernel with the proxy so the preview looks the same
+        intensity = max(1, int(round(params['intensity'] * ratio)))
+        params['intensity'] = intensity if intensity % 2 else intensity + 1
+    return img_ops.OPS[op](image, **params)
+
 
 class ImageProcessor:
-    def __init__(self):
+    def __init__(self, history_bytes=256 * 1024 * 1024, lazy=False, cache_dir=None,
+                 backend='auto', processes=None):
         self._original_image = None
         self._current_image = None
-        self._history = []
-        self._history_index = -1
+        # Recycled output buffers for ops, materialized views and history
+        self._arena = BufferArena()
+        self._history = HistoryStore(max_bytes=history_bytes, arena=self._arena)
+        # In lazy mode edits are recorded in an operation graph and only
+        # evaluated when the image is read or saved
+        self._lazy = lazy
+        self._graph = None
+        # Bumped on every change so caches keyed on the image can be invalidated
+        self._revision = 0
+        self._proxy = None
+        self._proxy_key = None
+        self._tiles = _TILES
+        # Large originals are memory-mapped from a raw cache here when set
+        self._cache_dir = cache_dir
+        # Compressed frames while the document is parked
+        self._packed = None
+        # Kernel implementations (see img_backends); resolved on first use
+        # because "auto" benchmarks the backends once per process
+        self._backend_name = backend
+        self._backend = None
+        # Optional img_shared.ProcessRunner (may be shared between
+        # processors) for recipes replayed on large images
+        self._processes = processes
+        # Op log for recipes: one group of (op, params) steps per undo step;
+        # groups past the head have been undone
+        self._log = []
+        self._log_head = 0
+        # (input, Transform) of the current run of rotate/flip/resize/scale
+        # edits; each edit in the run resamples once from that input
+        self._transform = None
 
     def load_image(self, filepath):
         try:
-            image = cv2.imread(filepath)
+            image = img_io.read_image(filepath, self._cache_dir)
             if image is None:
                 return False
-            self._original_image = image.copy()
-            self._current_image = image.copy()
-            self._history = [image.copy()]
-            self._history_index = 0
+            self.set_image(image)
             return True
         except Exception:
             return False
 
+    def set_image(self, image):
+        """Start a new document from an in-memory BGR image
+
+        The processor takes ownership: ``image`` is marked read-only in
+        place, so pass a copy if the caller still needs to modify it.
+        """
+        # The read-only original doubles as the first state; ops never
+        # write into their input, so no defensive copy is needed
+        image = freeze(image)
+        self._original_image = image
+        self._current_image = image
+        # Buffers of the previous document's sizes are of no further use
+        self._arena.clear()
+        self._arena.resize(ARENA_FRAMES * image.nbytes)
+        self._history.clear()
+        self._log = []
+        self._log_head = 0
+        self._transform = None
+        self._revision += 1
+        if self._lazy:
+            self._graph = OperationGraph(image)
+        else:
+            self._history.set_thumbnail(thumbnail(image))
+
     def save_image(self, filepath):
         try:
             if self._current_image is None:
                 return False
-            success = cv2.imwrite(filepath, self._current_image)
-            return success
+            if self._graph is None:
+                self._materialize()
+            return img_io.write_image(filepath, self._evaluate())
         except Exception:
             return False
 
+    def park(self):
+        """Compress the decoded frames to free memory; history is kept
+
+        A parked processor behaves as if no image were loaded until
+        ``unpark`` restores it.
+        """
+        if self._original_image is None or self._packed is not None:
+            return
+        packed = {}
+
+        def pack_once(image):
+            # The original and current state are often the same buffer
+            if id(image) not in packed:
+                packed[id(image)] = pack(image)
+            return packed[id(image)]
+
+        self._packed = (pack_once(self._original_image), pack_once(self._current_image))
+        self._history.compact()
+        if self._graph is not None:
+            self._graph.drop_cache()
+            self._graph.source = None
+        self._original_image = None
+        self._current_image = None
+        self._proxy = None
+        self._proxy_key = None
+        self._transform = None
+        self._arena.clear()
+
+    def unpark(self):
+        if self._packed is None:
+            return
+        original, current = self._packed
+        self._original_image = unpack(original)
+        self._current_image = self._original_image if current is original else unpack(current)
+        if self._graph is not None:
+            self._graph.source = self._original_image
+        self._packed = None
+
+    def is_parked(self):
+        return self._packed is not None
+
+    def compact_history(self, stop=None):
+        """Compress raw history frames; meant for an idle job on the document's lane
+
+        Whole-frame steps are recorded without copying, so this is what
+        keeps a run of global edits from filling the history budget.
+        ``stop()`` ends it early (see HistoryStore.compact).
+        """
+        return self._history.compact(stop)
+
     def get_current_image(self):
+        """Return the current image as a read-only array (no copy)
+
+        The buffer is frozen, so later edits or undo copy before writing
+        instead of changing what the caller holds. Use ``img_buffer.thaw``
+        to get a modifiable array.
+        """
         if self._current_image is None:
             return None
-        return self._current_image.copy()
+        with stage('get_image'):
+            return freeze(self._evaluate())
 
     def get_image_info(self):
         if self._current_image is None:
             return {"width": 0, "height": 0, "channels": 0}
-        height, width = self._current_image.shape[:2]
-        channels = 3 if len(self._current_image.shape) == 3 else 1
+        image = self._evaluate()
+        height, width = image.shape[:2]
+        channels = 3 if len(image.shape) == 3 else 1
         return {"width": width, "height": height, "channels": channels}
 
-    def _add_to_history(self, image):
-        self._history = self._history[:self._history_index + 1]
-        self._history.append(image.copy())
-        self._history_index += 1
-        if len(self._history) > 20:
-            self._history.pop(0)
-            self._history_index -= 1
+    def get_backend(self):
+        return self._backend_name
 
-    def undo(self):
-        if self._history_index > 0:
-            self._history_index -= 1
-            self._current_image = self._history[self._history_index].copy()
-            return True
+    def set_backend(self, name):
+        """Switch kernel implementations; every backend gives identical output"""
+        backend = img_backends.get_backend(name)
+        self._backend_name = name
+        self._backend = backend
+
+    def _kernel(self, op):
+        if self._backend is None:
+            self._backend = img_backends.get_backend(self._backend_name)
+        return self._backend.kernel(op)
+
+    def get_buffer_stats(self):
+        """Buffer arena counters: hits, misses, bytes_held and bytes_leased"""
+        return self._arena.stats()
+
+    def _output(self, op, params, image):
+        return self._arena.take(img_ops.output_shape(op, params, image.shape), image.dtype)
+
+    def _resample(self, image, width, height):
+        return img_ops.resize(image, width, height, out=self._arena.take(
+            img_ops.output_shape('resize', {'width': width, 'height': height}, image.shape),
+            image.dtype))
+
+    def get_revision(self):
+        return self._revision
+
+    def get_state_key(self):
+        """Hashable id of the current edit state, for display caches
+
+        Unlike the revision, the key comes back when undo/redo returns to a
+        state shown before.
+        """
+        if self._current_image is None:
+            return None
+        if self._graph is not None:
+            return self._graph.state_id()
+        return self._history.state_id()
+
+    def get_proxy(self, max_width, max_height):
+        """Downscaled copy of the current image that fits the given box
+
+        The proxy is cached until the image changes. Call it where the
+        processor is edited (the document's job lane) and hand the result
+        to ``render_preview``. Returns (proxy, ratio), or None without an image.
+        """
+        if self._current_image is None:
+            return None
+        key = (self._revision, max_width, max_height)
+        if self._proxy_key != key:
+            image = self._evaluate()
+            height, width = image.shape[:2]
+            ratio = min(1.0, max_width / width, max_height / height)
+            if ratio < 1.0:
+                proxy = _downsample(image, ratio)
+            else:
+                # Rotated or flipped views are copied; kernels need contiguous input
+                proxy = np.ascontiguousarray(image)
+            proxy = freeze(proxy)
+            self._proxy = (proxy, ratio)
+            self._proxy_key = key
+        return self._proxy
+
+    def _evaluate(self):
+        if self._graph is not None:
+            self._current_image = self._graph.evaluate()
+        return self._current_image
+
+    def _log_steps(self, steps):
+        del self._log[self._log_head:]
+        self._log.append(steps)
+        self._log_head += 1
+
+    def get_recipe(self):
+        """Recipe of the edits leading from the original to the current image"""
+        steps = []
+        for group in self._log[:self._log_head]:
+            if group == [('reset', {})]:
+                steps = []
+            else:
+                steps.extend(group)
+        return Recipe(steps)
+
+    def apply_recipe(self, recipe):
+        """Replay a recipe as a single edit (one undo step, no per-step history)"""
+        if self._current_image is None or not len(recipe):
+            return
+        if self._graph is not None:
+            self._revision += 1
+            for op, params in recipe.steps:
+                self._graph.record(op, params)
+            # Undo in lazy mode steps back one recorded op at a time
+            for op, params in recipe.steps:
+                self._log_steps([(op, params)])
+            return
+        previous = self._current_image
+        with stage('op'):
+            if self._in_process('recipe', previous):
+                self._current_image = self._processes.run_recipe(previous, recipe)
+            else:
+                self._current_image = recipe.apply(previous)
+        self._transform = None
+        self._revision += 1
+        self._add_to_history(previous)
+        self._log_steps(list(recipe.steps))
+
+    def _apply(self, op, **params):
+        if self._graph is not None:
+            self._graph.record(op, params)
+        elif op in img_ops.TRANSFORM_OPS:
+            self._apply_transform(op, params)
         else:
+            previous = self._materialize()
+            with stage('op'):
+                if op in _TILED_OPS and self._tiles.should_tile(previous):
+                    self._current_image = _TILED_OPS[op](
+                        self._tiles, previous, out=self._output(op, params, previous), **params)
+                else:
+                    self._current_image = self._kernel(op)(
+                        previous, out=self._output(op, params, previous), **params)
+            self._transform = None
+            self._add_to_history(previous)
+        # Only an edit that went through is logged: a kernel that raised
+        # leaves the state, its key and the recipe as they were
+        self._revision += 1
+        self._log_steps([(op, params)])
+
+    def _apply_transform(self, op, params):
+        """Fold a geometric edit into the current transform run
+
+        The run is replayed from the image it started on, so scaling down
+        and back up resamples once from the sharp input instead of twice.
+        Rotations and flips are strided views of the previous result until
+        an op needs contiguous pixels (see ``_materialize``), and undoing
+        them just takes another view.
+        """
+        previous = self._current_image
+        if self._transform is None:
+            self._transform = (previous, img_ops.Transform.of(previous))
+        source, transform = self._transform
+        with stage('op'):
+            saved = (transform.orientation, transform.width, transform.height)
+            transform.then(op, params)
+            try:
+                if op in img_ops.GEOMETRIC_OPS:
+                    # Resampling comes first in a transform, so a rotation or
+                    # flip is the previous result re-oriented: a view, never a resample
+                    self._current_image = freeze(
+                        img_ops.Orientation().then(op, params).view(previous))
+                else:
+                    self._current_image = freeze(transform.view(source, self._resample))
+            except BaseException:
+                # Take back the step, so the run matches the image again
+                transform.orientation, transform.width, transform.height = saved
+                raise
+        inverse = img_ops.inverse(op, params)
+        if inverse is None:
+            self._add_to_history(previous)
+            return
+        # Invertible ops keep a recipe in history instead of pixels
+        inverse_op, inverse_params = inverse
+        self._add_recipe_to_history(
+            img_ops.Orientation().then(op, params).view,
+            img_ops.Orientation().then(inverse_op, inverse_params).view,
+        )
+
+    def _in_process(self, op, image):
+        return self._processes is not None and self._processes.should_run(op, image)
+
+    def _materialize(self):
+        """Copy a rotated/flipped view of the current image into contiguous memory"""
+        image = self._current_image
+        if image is not None and not image.flags.c_contiguous:
+            with stage('materialize'):
+                out = self._arena.take_like(image)
+                np.copyto(out, image)
+                self._current_image = freeze(out)
+        return self._current_image
+
+    def _add_to_history(self, previous):
+        with stage('history'):
+            self._history.push(previous, self._current_image)
+            self._history.set_thumbnail(thumbnail(self._current_image))
+
+    def _add_recipe_to_history(self, forward, inverse):
+        with stage('history'):
+            self._history.push_recipe(forward, inverse)
+            self._history.set_thumbnail(thumbnail(self._current_image))
+
+    def get_history(self):
+        """``(states, position)`` for a history filmstrip, or None in lazy mode
+
+        ``states`` lists (state key, thumbnail) oldest first; thumbnails are
+        made once, when their step is recorded.
+        """
+        if self._graph is not None:
+            return None
+        return self._history.states(), self._history.position()
+
+    def jump_to(self, state):
+        """Go straight to a history state, by its key from get_history
+
+        Returns False when already there or when the state has been dropped.
+        Only the stored deltas between the two states are applied.
+        """
+        if self._current_image is None or self._graph is not None:
             return False
+        keys = [key for key, _ in self._history.states()]
+        start = self._history.position()
+        if state not in keys or keys.index(state) == start:
+            return False
+        self._transform = None
+        with stage('history'):
+            self._current_image = self._history.jump(self._current_image, state)
+        self._revision += 1
+        # The walk drops no steps, so the log moves by the same distance
+        self._log_head += keys.index(state) - start
+        return True
 
-    def redo(self):
-        if self._history_index < len(self._history) - 1:
-            self._history_index += 1
-            self._current_image = self._history[self._history_index].copy()
-            return True
+    def undo(self):
+        if self._current_image is None:
+            return False
+        self._transform = None
+        if self._graph is not None:
+            changed = self._graph.undo()
         else:
+            with stage('history'):
+                image = self._history.undo(self._current_image)
+            changed = image is not None
+            if changed:
+                self._current_image = image
+        if changed:
+            self._revision += 1
+            self._log_head -= 1
+        return changed
+
+    def redo(self):
+        if self._current_image is None:
             return False
+        self._transform = None
+        if self._graph is not None:
+            changed = self._graph.redo()
+        else:
+            with stage('history'):
+                image = self._history.redo(self._current_image)
+            changed = image is not None
+            if changed:
+                self._current_image = image
+        if changed:
+            self._revision += 1
+            self._log_head += 1
+        return changed
 
     def reset_to_original(self):
         if self._original_image is not None:
-            self._current_image = self._original_image.copy()
-            self._add_to_history(self._current_image)
+            self._revision += 1
+            self._log_steps([('reset', {})])
+            if self._graph is not None:
+                self._graph.reset()
+                return
+            previous = self._current_image
+            self._current_image = self._original_image
+            self._transform = None
+            self._add_to_history(previous)
 
     def convert_to_grayscale(self):
         if self._current_image is None:
             return
-        gray = cv2.cvtColor(self._current_image, cv2.COLOR_BGR2GRAY)
-        self._current_image = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
-        self._add_to_history(self._current_image)
+        self._apply('grayscale')
 
     def apply_blur(self, intensity=5):
         if self._current_image is None:
@@ -85,74 +554,76 @@ class ImageProcessor:
         intensity = max(1, intensity)
         if intensity % 2 == 0:
             intensity += 1
-        blurred = cv2.GaussianBlur(self._current_image, (intensity, intensity), 0)
-        self._current_image = blurred
-        self._add_to_history(self._current_image)
+        self._apply('blur', intensity=intensity)
 
     def detect_edges(self):
         if self._current_image is None:
             return
-        gray = cv2.cvtColor(self._current_image, cv2.COLOR_BGR2GRAY)
-        edges = cv2.Canny(gray, 100, 200)
-        self._current_image = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
-        self._add_to_history(self._current_image)
+        self._apply('edges')
 
     def adjust_brightness(self, value):
         if self._current_image is None:
             return
         value = max(-100, min(100, value))
-        adjusted = cv2.convertScaleAbs(self._current_image, alpha=1, beta=value)
-        self._current_image = adjusted
-        self._add_to_history(self._current_image)
+        self._apply('brightness', value=value)
 
     def adjust_contrast(self, value):
         if self._current_image is None:
             return
         value = max(0.5, min(3.0, value))
-        adjusted = cv2.convertScaleAbs(self._current_image, alpha=value, beta=0)
-        self._current_image = adjusted
-        self._add_to_history(self._current_image)
+        self._apply('contrast', value=value)
+
+    def adjust_gamma(self, value):
+        if self._current_image is None:
+            return
+        value = max(0.1, min(5.0, value))
+        self._apply('gamma', value=value)
+
+    def adjust_levels(self, black=0, white=255, gamma=1.0):
+        if self._current_image is None:
+            return
+        black = max(0, min(254, black))
+        white = max(black + 1, min(255, white))
+        self._apply('levels', black=black, white=white, gamma=gamma)
+
+    def apply_curve(self, points, channel=None):
+        if self._current_image is None:
+            return
+        if len(points) < 2:
+            return
+        self._apply('curve', points=list(points), channel=channel)
+
+    def apply_tone(self, pipeline):
+        """Apply every step of a TonePipeline as one edit and one pass"""
+        if self._current_image is None:
+            return
+        if not len(pipeline):
+            return
+        self._apply('tone', steps=list(pipeline.steps))
 
     def rotate_image(self, angle):
         if self._current_image is None:
             return
-        if angle == 90:
-            rotated = cv2.rotate(self._current_image, cv2.ROTATE_90_CLOCKWISE)
-        elif angle == 180:
-            rotated = cv2.rotate(self._current_image, cv2.ROTATE_180)
-        elif angle == 270:
-            rotated = cv2.rotate(self._current_image, cv2.ROTATE_90_COUNTERCLOCKWISE)
-        else:
+        if angle not in img_ops.ROTATE_CODES:
             return
-        self._current_image = rotated
-        self._add_to_history(self._current_image)
+        self._apply('rotate', angle=angle)
 
     def flip_image(self, direction):
         if self._current_image is None:
             return
-        if direction == 'horizontal':
-            flipped = cv2.flip(self._current_image, 1)
-        elif direction == 'vertical':
-            flipped = cv2.flip(self._current_image, 0)
-        else:
+        if direction not in img_ops.FLIP_CODES:
             return
-        self._current_image = flipped
-        self._add_to_history(self._current_image)
+        self._apply('flip', direction=direction)
 
     def resize_image(self, width, height):
         if self._current_image is None:
             return
         if width <= 0 or height <= 0:
             return
-        resized = cv2.resize(self._current_image, (width, height))
-        self._current_image = resized
-        self._add_to_history(self._current_image)
+        self._apply('resize', width=width, height=height)
 
     def scale_image(self, percent):
         if self._current_image is None:
             return
         percent = max(25, min(200, percent))
-        height, width = self._current_image.shape[:2]
-        new_width = int(width * percent / 100)
-        new_height = int(height * percent / 100)
-        self.resize_image(new_width, new_height)
\ No newline at end of file
+        self._apply('scale', percent=percent)
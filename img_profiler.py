@@ -0,0 +1,180 @@
+"""Opt-in timing of the editing hot path
+
+Code marks its stages with ``with img_profiler.stage('op'):``. While the
+profiler is disabled (the default) a stage is a shared no-op context, so the
+instrumentation costs next to nothing. When enabled, stages are grouped into
+the action (one user edit) made current by ``Profiler.activate`` in the job
+running them, and can be exported as Chrome trace-event JSON (load it in
+chrome://tracing or https://ui.perfetto.dev).
+"""
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+
+class Action:
+    """One user action and the stages timed while it ran"""
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.stages = []   # (name, start, duration, thread id)
+        # Peak traced allocation while the action's jobs ran, when tracked;
+        # an upper bound when other measured jobs overlapped them
+        self.peak_bytes = None
+        self.peak_shared = False
+
+    def breakdown(self):
+        """Total seconds per stage name, in first-seen order"""
+        totals = {}
+        for name, _, duration, _ in self.stages:
+            totals[name] = totals.get(name, 0.0) + duration
+        return totals
+
+    def summary(self):
+        parts = [f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.breakdown().items()]
+        if self.peak_bytes:
+            bound = "≤" if self.peak_shared else ""
+            parts.append(f"peak {bound}{self.peak_bytes / 2 ** 20:.1f} MB")
+        return f"{self.name}: " + " · ".join(parts) if parts else self.name
+
+
+class Profiler:
+    def __init__(self, max_actions=500):
+        self.enabled = False
+        self.track_memory = False
+        self.max_actions = max_actions
+        self.actions = []
+        # Set inside each job, so concurrent jobs never share an action
+        self._current = contextvars.ContextVar('img_profiler_action', default=None)
+        # Actions whose jobs are running with memory tracking
+        self._measuring = []
+        self._lock = threading.Lock()
+        self._null = contextlib.nullcontext()
+
+    def enable(self, track_memory=True):
+        self.enabled = True
+        self.track_memory = track_memory
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        self.enabled = False
+        if self.track_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.track_memory = False
+
+    def begin_action(self, name):
+        """Record a new action; returns it (or None), see ``activate``"""
+        if not self.enabled:
+            return None
+        action = Action(name)
+        with self._lock:
+            self.actions.append(action)
+            del self.actions[:-self.max_actions]
+        return action
+
+    @contextlib.contextmanager
+    def activate(self, action):
+        """Group the stages run in this block under ``action``
+
+        Use it inside the job doing the work, and again where the result
+        is shown on the UI thread. The action is current only in the
+        running context, so jobs on other threads are not affected. While
+        memory is tracked, the block's peak allocation is added to it.
+        """
+        if action is None:
+            yield None
+            return
+        token = self._current.set(action)
+        baseline = self._start_peak(action) if self.track_memory else None
+        try:
+            yield action
+        finally:
+            if baseline is not None:
+                self._stop_peak(action, baseline)
+            self._current.reset(token)
+
+    def _start_peak(self, action):
+        if not tracemalloc.is_tracing():
+            return None
+        with self._lock:
+            if self._measuring:
+                # The peak counter is process-wide and another job is using
+                # it, so this block's peak is shared with that job's
+                action.peak_shared = True
+                for other in self._measuring:
+                    other.peak_shared = True
+            else:
+                tracemalloc.reset_peak()
+            self._measuring.append(action)
+            return tracemalloc.get_traced_memory()[0]
+
+    def _stop_peak(self, action, baseline):
+        with self._lock:
+            _, peak = tracemalloc.get_traced_memory()
+            # Tracing may have stopped mid-job, which zeroes the counters
+            action.peak_bytes = max(action.peak_bytes or 0, peak - baseline, 0)
+            self._measuring.remove(action)
+
+    def end_action(self, action):
+        if action is not None:
+            action.end = time.perf_counter()
+
+    def stage(self, name):
+        if not self.enabled:
+            return self._null
+        return self._timed(name)
+
+    @contextlib.contextmanager
+    def _timed(self, name):
+        action = self._current.get()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            if action is not None:
+                with self._lock:
+                    action.stages.append((name, start, duration, threading.get_ident()))
+
+    def last_action(self):
+        return self.actions[-1] if self.actions else None
+
+    def export_chrome_trace(self, filepath):
+        """Write all recorded actions as Chrome trace-event JSON"""
+        pid = os.getpid()
+        events = []
+        for action in list(self.actions):
+            end = action.end if action.end is not None else action.start
+            for _, stage_start, duration, _ in action.stages:
+                end = max(end, stage_start + duration)
+            event = {
+                'name': action.name, 'cat': 'action', 'ph': 'X', 'pid': pid, 'tid': 0,
+                'ts': action.start * 1e6, 'dur': (end - action.start) * 1e6,
+            }
+            if action.peak_bytes is not None:
+                event['args'] = {'peak_bytes': action.peak_bytes,
+                                 'peak_shared': action.peak_shared}
+            events.append(event)
+            for name, stage_start, duration, thread in action.stages:
+                events.append({
+                    'name': name, 'cat': 'stage', 'ph': 'X', 'pid': pid, 'tid': thread,
+                    'ts': stage_start * 1e6, 'dur': duration * 1e6,
+                    'args': {'action': action.name},
+                })
+        with open(filepath, 'w') as handle:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, handle)
+
+
+# Shared instance used by the processor, the display and the editor
+PROFILER = Profiler()
+
+
+def stage(name):
+    return PROFILER.stage(name)
@@ -0,0 +1,58 @@
+"""Recorded edit recipes that can be saved and replayed on other images
+
+A recipe is the list of ``(op, params)`` steps an ImageProcessor applied,
+using the op names of ``img_ops.OPS``. It is stored as compact JSON:
+
+    {"version": 1, "steps": [["blur", {"intensity": 5}], ["rotate", {"angle": 90}]]}
+"""
+import json
+
+import img_ops
+from img_graph import OpNode, fuse
+
+
+RECIPE_VERSION = 1
+
+
+class Recipe:
+    def __init__(self, steps=()):
+        self.steps = [(op, dict(params)) for op, params in steps]
+        for op, _ in self.steps:
+            if op not in img_ops.OPS:
+                raise ValueError(f"Unknown recipe operation: {op}")
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __eq__(self, other):
+        return isinstance(other, Recipe) and self.steps == other.steps
+
+    def apply(self, image):
+        """Replay the recipe on an image, fused, without any history
+
+        Adjacent tone ops cost one LUT pass and adjacent rotations/flips one
+        remap, exactly as in lazy mode. Returns a new array.
+        """
+        for _, apply in fuse([OpNode(op, params) for op, params in self.steps]):
+            image = apply(image)
+        return image
+
+    def dumps(self):
+        return json.dumps({'version': RECIPE_VERSION, 'steps': self.steps},
+                          separators=(',', ':'))
+
+    @classmethod
+    def loads(cls, text):
+        data = json.loads(text)
+        if not isinstance(data, dict) or data.get('version') != RECIPE_VERSION:
+            raise ValueError("Not a recipe file (or an unsupported version)")
+        return cls((op, params) for op, params in data['steps'])
+
+    def save(self, filepath):
+        with open(filepath, 'w') as handle:
+            handle.write(self.dumps())
+
+    @classmethod
+    def load(cls, filepath):
+        with open(filepath) as handle:
+            return cls.loads(handle.read())
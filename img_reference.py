@@ -0,0 +1,130 @@
+"""Pure-NumPy versions of the simple img_ops kernels
+
+They reproduce OpenCV's integer arithmetic exactly, so their output is
+bit-identical to the cv2 kernels in img_ops. Tone ops are single
+``np.take`` lookups, grayscale accumulates in one int32 buffer with
+in-place ufuncs, and flips/rotations are strided views (``*_view``) that
+are only copied when a contiguous result is asked for.
+
+``check_parity`` compares them with the cv2 kernels (see
+tests/test_reference.py).
+"""
+import numpy as np
+
+
+# cv2.COLOR_BGR2GRAY fixed-point weights (15-bit)
+_GRAY_B, _GRAY_G, _GRAY_R, _GRAY_SHIFT = 3735, 19235, 9798, 15
+
+
+def _scale_abs_table(alpha, beta):
+    # cv2.convertScaleAbs: |x * alpha + beta| in float32 with a fused
+    # multiply-add, rounded half to even. The float64 product of a uint8
+    # and a float32 is exact, so one cast to float32 is the FMA rounding.
+    x = np.arange(256, dtype=np.float64) * float(np.float32(alpha)) + float(np.float32(beta))
+    return np.clip(np.rint(np.abs(x.astype(np.float32))), 0, 255).astype(np.uint8)
+
+
+def _lookup(image, table, out):
+    if out is None:
+        out = np.empty_like(image)
+    # mode='clip' lets take write straight into out instead of buffering
+    return np.take(table, image, out=out, mode='clip')
+
+
+def grayscale(image, out=None):
+    if image.ndim == 2:
+        return _materialize(image, out)
+    acc = np.multiply(image[..., 0], _GRAY_B, dtype=np.int32)
+    term = np.empty_like(acc)
+    np.multiply(image[..., 1], _GRAY_G, out=term, dtype=np.int32)
+    acc += term
+    np.multiply(image[..., 2], _GRAY_R, out=term, dtype=np.int32)
+    acc += term
+    del term
+    acc += 1 << (_GRAY_SHIFT - 1)
+    acc >>= _GRAY_SHIFT
+    if out is None:
+        out = np.empty(image.shape[:2], dtype=np.uint8)
+    np.copyto(out, acc, casting='unsafe')
+    return out
+
+
+def brightness(image, value, out=None):
+    return _lookup(image, _scale_abs_table(1, value), out)
+
+
+def contrast(image, value, out=None):
+    return _lookup(image, _scale_abs_table(value, 0), out)
+
+
+def rotate_view(image, angle):
+    """Clockwise rotation as a zero-copy view"""
+    return np.rot90(image, -(angle // 90))
+
+
+def flip_view(image, direction):
+    """Flip as a zero-copy view"""
+    return image[:, ::-1] if direction == 'horizontal' else image[::-1]
+
+
+def _materialize(view, out):
+    if out is None:
+        return np.ascontiguousarray(view)
+    np.copyto(out, view)
+    return out
+
+
+def rotate(image, angle, out=None):
+    return _materialize(rotate_view(image, angle), out)
+
+
+def flip(image, direction, out=None):
+    return _materialize(flip_view(image, direction), out)
+
+
+# Operation name -> kernel, for the ops implemented here
+KERNELS = {
+    'grayscale': grayscale,
+    'brightness': brightness,
+    'contrast': contrast,
+    'rotate': rotate,
+    'flip': flip,
+}
+
+# Parameters covered by check_parity
+PARITY_CASES = {
+    'grayscale': [{}],
+    'brightness': [{'value': v} for v in range(-100, 101)],
+    'contrast': [{'value': round(0.5 + i * 0.01, 2)} for i in range(251)],
+    'rotate': [{'angle': angle} for angle in (90, 180, 270)],
+    'flip': [{'direction': direction} for direction in ('horizontal', 'vertical')],
+}
+
+
+def parity_image():
+    """Every BGR colour once (4096 x 4096), so tone and gray tables are fully covered"""
+    values = np.arange(256, dtype=np.uint8)
+    image = np.empty((256, 256, 256, 3), dtype=np.uint8)
+    image[..., 0] = values[:, None, None]
+    image[..., 1] = values[None, :, None]
+    image[..., 2] = values[None, None, :]
+    return image.reshape(4096, 4096, 3)
+
+
+def check_parity(image=None, cases=None):
+    """Compare every kernel with its cv2 counterpart; returns mismatch descriptions"""
+    import img_ops
+
+    if image is None:
+        image = parity_image()
+    mismatches = []
+    for op, param_sets in (cases or PARITY_CASES).items():
+        for params in param_sets:
+            expected = img_ops.OPS[op](image, **params)
+            for label, result in (
+                ('', KERNELS[op](image, **params)),
+                (' (out=)', KERNELS[op](image, out=np.empty_like(expected), **params)),
+            ):
+                if result.shape != expected.shape or not np.array_equal(result, expected):
+                    mismatches.append(f"{op} {params}{label}")
+    return mismatches
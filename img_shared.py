@@ -0,0 +1,223 @@
+"""Worker processes that exchange frames through shared memory
+
+Frames never go through pickle: the parent copies the input into a
+``multiprocessing.shared_memory`` block (or passes a block it already
+owns), the worker attaches to it by name and writes its result into a
+second block, and the parent wraps that block as the result array without
+copying. Blocks are recycled through a pool keyed by shape and dtype and
+return to it once the array using them is garbage collected.
+"""
+import multiprocessing
+import sys
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import img_ops
+
+
+# Ops that may run in a worker process. A single op is faster in the
+# editor's own process (the frame copies and the round trip cost more than
+# the op), so only recipes, which replay several steps per frame, go out
+PROCESS_OPS = ('recipe',)
+
+
+def _attach(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def _run_in_worker(op, params, source, target):
+    """Worker entry point; ``source``/``target`` are (name, shape, dtype)"""
+    blocks = [_attach(source[0]), _attach(target[0])]
+    try:
+        image = np.ndarray(source[1], dtype=source[2], buffer=blocks[0].buf)
+        out = np.ndarray(target[1], dtype=target[2], buffer=blocks[1].buf)
+        if op == 'recipe':
+            from img_recipe import Recipe
+            result = Recipe(params['steps']).apply(image)
+        else:
+            result = img_ops.OPS[op](image, out=out, **params)
+        if result is not out:
+            np.copyto(out, result)
+        del image, out, result
+    finally:
+        for block in blocks:
+            block.close()
+
+
+class SharedFrame:
+    """One shared memory block sized for a given shape and dtype"""
+
+    def __init__(self, shape, dtype):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        nbytes = max(1, int(np.prod(self.shape)) * self.dtype.itemsize)
+        self.block = shared_memory.SharedMemory(create=True, size=nbytes)
+
+    @property
+    def name(self):
+        return self.block.name
+
+    @property
+    def nbytes(self):
+        return self.block.size
+
+    def descriptor(self):
+        return self.block.name, self.shape, self.dtype.str
+
+    def array(self):
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=self.block.buf)
+
+    def destroy(self):
+        try:
+            self.block.close()
+        except BufferError:
+            # Still exported by a live array; unlinking is enough
+            pass
+        try:
+            self.block.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedBufferPool:
+    """Reusable shared frames keyed by (shape, dtype)
+
+    Idle frames are kept up to ``max_idle_bytes``; beyond that they are
+    unlinked. Arrays handed out by ``wrap`` give their frame back when
+    they are garbage collected.
+    """
+
+    def __init__(self, max_idle_bytes=512 * 1024 * 1024):
+        self.max_idle_bytes = max_idle_bytes
+        self._idle = {}
+        self._idle_bytes = 0
+        self._in_use = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, shape, dtype):
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            frames = self._idle.get(key)
+            if frames:
+                frame = frames.pop()
+                self._idle_bytes -= frame.nbytes
+                self.reused += 1
+                return frame
+            self.created += 1
+        return SharedFrame(shape, dtype)
+
+    def release(self, frame):
+        key = (frame.shape, frame.dtype.str)
+        with self._lock:
+            self._in_use.pop(frame.name, None)
+            if not self._closed and self._idle_bytes + frame.nbytes <= self.max_idle_bytes:
+                self._idle.setdefault(key, []).append(frame)
+                self._idle_bytes += frame.nbytes
+                return
+        frame.destroy()
+
+    def wrap(self, frame):
+        """Array view of a frame; the frame returns to the pool with the array"""
+        array = frame.array()
+        with self._lock:
+            self._in_use[frame.name] = (frame, weakref.ref(array))
+        weakref.finalize(array, self.release, frame)
+        return array
+
+    def owner(self, image):
+        """The frame behind an array from ``wrap`` (or a view of one), else None"""
+        base = image
+        while base is not None:
+            with self._lock:
+                for frame, ref in self._in_use.values():
+                    if ref() is base:
+                        return frame
+            base = base.base if isinstance(base, np.ndarray) else None
+        return None
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            frames = [frame for frames in self._idle.values() for frame in frames]
+            frames += [frame for frame, _ in self._in_use.values()]
+            self._idle.clear()
+            self._idle_bytes = 0
+            self._in_use.clear()
+        for frame in frames:
+            frame.destroy()
+
+
+class ProcessRunner:
+    """Runs CPU-heavy ops in worker processes on shared-memory frames
+
+    Only recipes on images of at least ``min_pixels`` are worth the round
+    trip; the pool starts on first use, so an editor that never replays a
+    recipe never spawns a worker.
+    """
+
+    def __init__(self, max_workers=None, min_pixels=img_ops.PARALLEL_MIN_PIXELS, buffers=None):
+        self.max_workers = max_workers
+        self.min_pixels = min_pixels
+        self.buffers = buffers or SharedBufferPool()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def should_run(self, op, image):
+        return op in PROCESS_OPS and image.shape[0] * image.shape[1] >= self.min_pixels
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawned workers do not inherit the Tk or thread state
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def submit(self, op, image, **params):
+        """Start ``op`` in a worker; returns a function that waits for the result"""
+        source = self.buffers.owner(image)
+        if source is None or source.shape != image.shape or not image.flags.c_contiguous:
+            source = self.buffers.acquire(image.shape, image.dtype)
+            np.copyto(source.array(), image)
+            held = source
+        else:
+            held = None
+        target = self.buffers.acquire(img_ops.output_shape(op, params, image.shape), image.dtype)
+        future = self._pool().submit(_run_in_worker, op, params,
+                                     source.descriptor(), target.descriptor())
+
+        # The image is kept alive until the worker is done reading its frame
+        def result(image=image):
+            try:
+                future.result()
+            except BaseException:
+                self.buffers.release(target)
+                raise
+            finally:
+                if held is not None:
+                    self.buffers.release(held)
+            return self.buffers.wrap(target)
+        return result
+
+    def run(self, op, image, **params):
+        return self.submit(op, image, **params)()
+
+    def run_recipe(self, image, recipe):
+        return self.run('recipe', image, steps=recipe.steps)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+        self.buffers.close()
@@ -0,0 +1,97 @@
+import cv2
+import numpy as np
+
+
+_IDENTITY = np.arange(256, dtype=np.uint8)
+
+
+def _brightness(table, value):
+    # Same arithmetic as cv2.convertScaleAbs so LUT results stay bit-identical
+    return cv2.convertScaleAbs(table, alpha=1, beta=value)
+
+
+def _contrast(table, value):
+    return cv2.convertScaleAbs(table, alpha=value, beta=0)
+
+
+def _gamma(table, value):
+    value = max(0.1, value)
+    mapping = np.round(255.0 * (_IDENTITY / 255.0) ** (1.0 / value))
+    return np.take(mapping.astype(np.uint8), table)
+
+
+def _levels(table, black=0, white=255, gamma=1.0, out_black=0, out_white=255):
+    white = max(white, black + 1)
+    normalized = np.clip((_IDENTITY.astype(np.float64) - black) / (white - black), 0.0, 1.0)
+    normalized **= 1.0 / max(0.1, gamma)
+    mapping = np.round(out_black + normalized * (out_white - out_black))
+    return np.take(np.clip(mapping, 0, 255).astype(np.uint8), table)
+
+
+def _curve(table, points):
+    # Piecewise-linear curve through (input, output) control points
+    xs, ys = zip(*sorted(points))
+    mapping = np.round(np.interp(_IDENTITY, xs, ys))
+    return np.take(np.clip(mapping, 0, 255).astype(np.uint8), table)
+
+
+# Point op name -> function(uint8 table, **params) returning the remapped table
+POINT_OPS = {
+    'brightness': _brightness,
+    'contrast': _contrast,
+    'gamma': _gamma,
+    'levels': _levels,
+    'curve': _curve,
+}
+
+
+class TonePipeline:
+    """Sequence of point ops folded into one lookup table per channel
+
+    Any number of steps costs a single ``cv2.LUT`` pass over the image.
+    Steps may target one BGR channel via ``channel=0..2``; otherwise they
+    apply to every channel. A single-channel image stays single-channel
+    unless a step targets a channel, which expands it to BGR.
+    """
+
+    def __init__(self, steps=None):
+        self.steps = []
+        for op, params in steps or ():
+            self.add(op, **params)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def add(self, op, **params):
+        if op == 'tone':
+            for step in params['steps']:
+                self.add(step[0], **step[1])
+            return self
+        if op not in POINT_OPS:
+            raise ValueError(f"Not a point operation: {op}")
+        self.steps.append((op, params))
+        return self
+
+    def needs_color(self):
+        return any(params.get('channel') is not None for _, params in self.steps)
+
+    def lut(self, channels=1):
+        """Return a (1, 256) table, or (1, 256, channels) if channels differ"""
+        tables = np.tile(_IDENTITY, (channels, 1))
+        for op, params in self.steps:
+            params = dict(params)
+            channel = params.pop('channel', None)
+            function = POINT_OPS[op]
+            if channel is None:
+                tables = function(tables, **params)
+            elif channel < channels:
+                tables[channel] = function(tables[channel:channel + 1], **params)[0]
+        if channels == 1 or (tables == tables[0]).all():
+            return tables[:1]
+        return np.ascontiguousarray(tables.T).reshape(1, 256, channels)
+
+    def apply(self, image, out=None):
+        if image.ndim == 2 and self.needs_color():
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        channels = image.shape[2] if image.ndim == 3 else 1
+        return cv2.LUT(image, self.lut(channels), dst=out)
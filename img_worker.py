@@ -0,0 +1,157 @@
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    """Handle for a submitted job"""
+
+    def __init__(self, on_done, on_error, lane=None, background=False):
+        self.lane = lane
+        self.background = background
+        self.on_done = on_done
+        self.on_error = on_error
+        self.future = None
+        self.cancelled = False
+
+    def cancel(self):
+        """Drop the job; its result is ignored even if it is already running"""
+        self.cancelled = True
+        # A lane job must still run (as a no-op) so the rest of its lane starts
+        if self.future is not None and self.lane is None:
+            self.future.cancel()
+
+
+class JobRunner:
+    """Runs processing jobs off the Tk thread and delivers results back on it
+
+    OpenCV releases the GIL, so worker threads keep the UI responsive while
+    a large image is processed. Results are handed back through ``root.after``
+    polling so callbacks always run on the Tk thread.
+
+    Jobs in the same ``lane`` (anything that mutates one ImageProcessor)
+    run one at a time, in submission order, while different lanes share the
+    bounded pool in parallel. ``exclusive=True`` is the default lane.
+    ``submit`` returns a Job whose ``cancel`` drops it, e.g. once a newer
+    request has superseded it.
+
+    ``background`` jobs are housekeeping the user did not ask for: they are
+    left out of ``active`` and progress reports, and they give way to any
+    other job submitted on their lane. Their ``fn`` is called with a
+    ``stop`` keyword, a function that returns True once that has happened,
+    so long-running housekeeping can end early.
+    """
+
+    def __init__(self, root, max_workers=None, poll_ms=30, on_progress=None):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.on_progress = on_progress
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._lanes = {}
+        self._lock = threading.Lock()
+        self._results = queue.Queue()
+        self._active = []
+        self._poll_job = None
+
+    @property
+    def active(self):
+        return sum(1 for job in self._active if not job.background)
+
+    def submit(self, fn, *args, on_done=None, on_error=None, exclusive=False,
+               lane=None, background=False):
+        if exclusive and lane is None:
+            lane = 'main'
+        if lane is not None and not background:
+            for other in self._active:
+                if other.lane == lane and other.background:
+                    other.cancel()
+        job = Job(on_done, on_error, lane, background)
+        self._active.append(job)
+        if lane is None:
+            job.future = self._pool.submit(self._run, job, fn, args)
+        else:
+            with self._lock:
+                waiting = self._lanes.setdefault(lane, deque())
+                waiting.append((job, fn, args))
+                if len(waiting) == 1:
+                    self._start_lane(lane)
+        self._changed()
+        if self._poll_job is None:
+            self._poll_job = self.root.after(self.poll_ms, self._poll)
+        return job
+
+    def cancel_all(self):
+        for job in self._active:
+            job.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+        self._pool.shutdown(wait=False)
+
+    def _start_lane(self, lane):
+        # Called with the lock held
+        job, fn, args = self._lanes[lane][0]
+        try:
+            job.future = self._pool.submit(self._run_lane, lane, job, fn, args)
+        except RuntimeError:
+            # Pool shut down; nothing more will run
+            del self._lanes[lane]
+
+    def _run_lane(self, lane, job, fn, args):
+        try:
+            self._run(job, fn, args)
+        finally:
+            with self._lock:
+                waiting = self._lanes[lane]
+                waiting.popleft()
+                if waiting:
+                    self._start_lane(lane)
+                else:
+                    del self._lanes[lane]
+
+    def _run(self, job, fn, args):
+        if job.cancelled:
+            self._results.put((job, None, None))
+            return
+        try:
+            if job.background:
+                result = fn(*args, stop=lambda: job.cancelled)
+            else:
+                result = fn(*args)
+            self._results.put((job, result, None))
+        except Exception as error:
+            self._results.put((job, None, error))
+
+    def _poll(self):
+        self._poll_job = None
+        # Futures cancelled before they started never report back
+        finished = [job for job in self._active
+                    if job.future is not None and job.future.cancelled()]
+        while True:
+            try:
+                finished.append(self._results.get_nowait())
+            except queue.Empty:
+                break
+        for item in finished:
+            if isinstance(item, Job):
+                job, result, error = item, None, None
+            else:
+                job, result, error = item
+            if job in self._active:
+                self._active.remove(job)
+            if job.cancelled:
+                continue
+            if error is not None:
+                if job.on_error is not None:
+                    job.on_error(error)
+            elif job.on_done is not None:
+                job.on_done(result)
+        if finished:
+            self._changed()
+        if self._active:
+            self._poll_job = self.root.after(self.poll_ms, self._poll)
+
+    def _changed(self):
+        if self.on_progress is not None:
+            self.on_progress(self.active)
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from img_buffer import BufferArena, freeze, thaw
+from img_processor import ImageProcessor
+
+
+@pytest.fixture
+def processor():
+    image = np.random.default_rng(2).integers(0, 256, (60, 80, 3), dtype=np.uint8)
+    processor = ImageProcessor(backend='numpy')
+    processor.set_image(image)
+    return processor
+
+
+def test_thaw_copies_only_frozen_arrays():
+    image = np.zeros((4, 4), np.uint8)
+    assert thaw(image) is image
+    assert freeze(image) is image
+    assert not image.flags.writeable
+    copy = thaw(image)
+    assert copy is not image and copy.flags.writeable
+
+
+def test_current_image_is_read_only_and_not_copied(processor):
+    image = processor.get_current_image()
+    assert not image.flags.writeable
+    assert processor.get_current_image() is image
+    with pytest.raises(ValueError):
+        image[0, 0] = 0
+
+
+@pytest.mark.parametrize('edit', [
+    lambda p: p.apply_blur(5),
+    lambda p: p.adjust_brightness(40),
+    lambda p: p.flip_image('horizontal'),
+])
+def test_edits_and_undo_never_write_into_handed_out_images(processor, edit):
+    handed_out = processor.get_current_image()
+    snapshot = handed_out.copy()
+    edit(processor)
+    edited = processor.get_current_image()
+    edited_snapshot = edited.copy()
+    processor.undo()
+    assert np.array_equal(processor.get_current_image(), snapshot)
+    processor.redo()
+    assert np.array_equal(handed_out, snapshot)
+    assert np.array_equal(edited, edited_snapshot)
+
+
+def test_arena_recycles_released_buffers():
+    arena = BufferArena()
+    first = arena.take((8, 8, 3))
+    del first
+    second = arena.take((8, 8, 3))
+    view = second[2:4]
+    del second
+    # A live view keeps the lease out of the arena
+    arena.take((8, 8, 3))
+    assert arena.stats()['hits'] == 1
+    del view
+    arena.take((8, 8, 3))
+    assert arena.stats()['hits'] == 2
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import img_ops
+from img_graph import OperationGraph
+
+
+@pytest.fixture
+def source():
+    image = np.random.default_rng(0).integers(0, 256, (120, 160, 3), dtype=np.uint8)
+    image.flags.writeable = False
+    return image
+
+
+def record(graph, steps, read=True):
+    for op, params in steps:
+        graph.record(op, params)
+        if read:
+            graph.evaluate()
+
+
+@pytest.mark.parametrize('steps', [
+    [('scale', {'percent': 25}), ('scale', {'percent': 200})],
+    [('flip', {'direction': 'vertical'}), ('scale', {'percent': 50}),
+     ('rotate', {'angle': 90}), ('scale', {'percent': 150})],
+    [('resize', {'width': 40, 'height': 70}), ('rotate', {'angle': 270}),
+     ('flip', {'direction': 'horizontal'})],
+])
+@pytest.mark.parametrize('read', [False, True])
+def test_transform_run_resamples_once(source, steps, read):
+    # Reading in between caches results inside the run; the run must still
+    # be replayed from the source in one resample
+    graph = OperationGraph(source)
+    record(graph, steps, read)
+    assert np.array_equal(graph.evaluate(), img_ops.transform(source, steps))
+
+
+def test_run_restarts_after_last_non_transform(source):
+    graph = OperationGraph(source)
+    record(graph, [('brightness', {'value': 20}), ('scale', {'percent': 25}),
+                   ('scale', {'percent': 200})])
+    brightened = img_ops.brightness(source, 20)
+    expected = img_ops.transform(brightened, [('scale', {'percent': 25}), ('scale', {'percent': 200})])
+    assert np.array_equal(graph.evaluate(), expected)
+
+
+def test_undo_redo_move_the_head(source):
+    graph = OperationGraph(source)
+    record(graph, [('scale', {'percent': 50}), ('blur', {'intensity': 5})])
+    blurred = graph.evaluate().copy()
+    assert graph.undo()
+    assert graph.evaluate().shape == (60, 80, 3)
+    assert graph.redo()
+    assert np.array_equal(graph.evaluate(), blurred)
+    graph.reset()
+    assert np.array_equal(graph.evaluate(), source)
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+import img_ops
+from img_history import HistoryStore
+
+
+@pytest.fixture
+def frames():
+    rng = np.random.default_rng(1)
+    first = rng.integers(0, 256, (80, 100, 3), dtype=np.uint8)
+    # A local edit, a global one and a change of shape
+    second = first.copy()
+    second[10:30, 40:70] = 0
+    third = img_ops.brightness(second, 25)
+    fourth = img_ops.rotate(third, 90)
+    return [first, second, third, fourth]
+
+
+def record(history, frames):
+    for before, after in zip(frames, frames[1:]):
+        history.push(before, after)
+
+
+def test_undo_redo_round_trip(frames):
+    history = HistoryStore()
+    record(history, frames)
+    current = frames[-1]
+    for expected in reversed(frames[:-1]):
+        current = history.undo(current)
+        assert np.array_equal(current, expected)
+    assert history.undo(current) is None
+    for expected in frames[1:]:
+        current = history.redo(current)
+        assert np.array_equal(current, expected)
+    assert history.redo(current) is None
+
+
+def test_local_edit_keeps_only_the_changed_block(frames):
+    history = HistoryStore()
+    history.push(frames[0], frames[1])
+    # 20 x 30 pixels of 100 x 80, packed or not
+    assert history.nbytes < frames[0].nbytes // 10
+
+
+def test_compact_keeps_states(frames):
+    history = HistoryStore()
+    record(history, frames)
+    raw = history.nbytes
+    assert history.compact()
+    assert history.nbytes < raw
+    current = frames[-1]
+    for expected in reversed(frames[:-1]):
+        current = history.undo(current)
+        assert np.array_equal(current, expected)
+
+
+def test_compact_stops_when_asked(frames):
+    history = HistoryStore()
+    record(history, frames)
+    assert not history.compact(stop=lambda: True)
+    assert np.array_equal(history.undo(frames[-1]), frames[-2])
+
+
+def test_budget_drops_oldest_but_keeps_min_steps(frames):
+    history = HistoryStore(max_bytes=1, min_steps=2)
+    record(history, frames)
+    assert len(history) == 2
+    assert np.array_equal(history.undo(frames[-1]), frames[-2])
+
+
+def test_jump_reaches_any_kept_state(frames):
+    history = HistoryStore()
+    record(history, frames)
+    states = [state for state, _ in history.states()]
+    assert np.array_equal(history.jump(frames[-1], states[0]), frames[0])
+    assert history.position() == 0
+    assert np.array_equal(history.jump(frames[0], states[2]), frames[2])
+    assert history.jump(frames[2], ('history', -1)) is None
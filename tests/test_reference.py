@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import img_backends
+import img_ops
+import img_reference
+
+
+# One parameter set per kernel in img_ops.OPS
+OP_CASES = {
+    'grayscale': {},
+    'blur': {'intensity': 5},
+    'edges': {},
+    'brightness': {'value': 30},
+    'contrast': {'value': 1.5},
+    'gamma': {'value': 0.8},
+    'levels': {'black': 10, 'white': 240, 'gamma': 1.2},
+    'curve': {'points': [(0, 0), (128, 160), (255, 255)]},
+    'tone': {'steps': [('brightness', {'value': 10}), ('gamma', {'value': 1.2})]},
+    'rotate': {'angle': 90},
+    'flip': {'direction': 'vertical'},
+    'resize': {'width': 50, 'height': 30},
+    'scale': {'percent': 150},
+}
+
+
+@pytest.fixture(scope='module')
+def image():
+    return img_backends.probe_image(96, 64)
+
+
+def test_every_op_has_a_case():
+    assert set(OP_CASES) == set(img_ops.OPS)
+
+
+@pytest.mark.parametrize('op', sorted(img_ops.OPS))
+def test_out_matches_allocated(image, op):
+    params = OP_CASES[op]
+    expected = img_ops.OPS[op](image, **params)
+    assert expected.shape == img_ops.output_shape(op, params, image.shape)
+    out = np.empty(expected.shape, expected.dtype)
+    assert img_ops.OPS[op](image, out=out, **params) is out
+    assert np.array_equal(out, expected)
+
+
+@pytest.mark.parametrize('op', sorted(img_ops.OPS))
+@pytest.mark.parametrize('name', img_backends.available_backends())
+def test_backends_match_numpy(image, op, name):
+    params = OP_CASES[op]
+    expected = img_ops.OPS[op](image, **params)
+    result = img_backends.get_backend(name).run(op, image, **params)
+    assert result.shape == expected.shape
+    assert np.array_equal(result, expected)
+
+
+@pytest.mark.parametrize('op', sorted(img_ops.OPS))
+def test_reference_matches_cv2(image, op):
+    if op not in img_reference.KERNELS:
+        pytest.skip(f"no pure-NumPy {op}")
+    assert img_reference.check_parity(image, {op: [OP_CASES[op]]}) == []
+
+
+@pytest.mark.parametrize('op', ['brightness', 'contrast'])
+def test_reference_tone_sweep(op):
+    # Tone tables only depend on the 256 input values, so a single row of
+    # the parity image covers the full slider range
+    row = np.ascontiguousarray(img_reference.parity_image()[:1])
+    assert img_reference.check_parity(row, {op: img_reference.PARITY_CASES[op]}) == []
+
+
+@pytest.mark.parametrize('op', ['grayscale', 'rotate', 'flip'])
+def test_reference_every_colour(op):
+    assert img_reference.check_parity(cases={op: img_reference.PARITY_CASES[op]}) == []
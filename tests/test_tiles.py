@@ -0,0 +1,43 @@
+import cv2
+import numpy as np
+import pytest
+
+import img_ops
+from img_processor import ImageProcessor, TileEngine, _TILED_OPS
+
+
+@pytest.fixture(scope='module')
+def engine():
+    # Small strips and no size threshold, so a small image spans many strips
+    return TileEngine(max_workers=4, strip_rows=16, min_pixels=0)
+
+
+@pytest.fixture(scope='module')
+def image():
+    return np.random.default_rng(3).integers(0, 256, (203, 150, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize('op, params', [
+    ('blur', {'intensity': 3}),
+    ('blur', {'intensity': 31}),
+    ('edges', {}),
+])
+def test_tiled_ops_are_bit_identical(engine, image, op, params):
+    expected = img_ops.OPS[op](image, **params)
+    assert np.array_equal(_TILED_OPS[op](engine, image, **params), expected)
+    out = np.empty_like(expected)
+    assert _TILED_OPS[op](engine, image, out=out, **params) is out
+    assert np.array_equal(out, expected)
+
+
+def test_pointwise_strips_write_into_output(engine, image):
+    result = engine.run(image, lambda strip, dst: cv2.bitwise_not(strip, dst=dst))
+    assert np.array_equal(result, cv2.bitwise_not(image))
+
+
+def test_processor_tiles_large_images(engine, image):
+    processor = ImageProcessor(backend='numpy')
+    processor._tiles = engine
+    processor.set_image(image)
+    processor.apply_blur(9)
+    assert np.array_equal(processor.get_current_image(), img_ops.blur(image, 9))